@@ -0,0 +1,446 @@
+#Benchmarks of the costs, samplers and fitting entry points, runnable offline:
+#    python Benchmarks.py --events 1e3,1e5 --npars 2,8 --workers 1,4 --output baseline.json
+#    python Benchmarks.py --compare baseline.json --threshold 0.2
+#Each benchmark is run for every combination of the parameters it depends on. For each one we report the time (best of --repeat),
+#the throughput (events/s or fits/s), the peak memory allocated during one run (from tracemalloc, in this process only, not in the workers) and the Minuit nfcn.
+#Before the benchmarks, the import time of the modules used by short batch jobs is checked against IMPORT_BUDGETS (skip with --no-imports).
+#The script exits with status 1 if an import is over budget or, with --compare, if a benchmark got slower, used more memory
+#or more function calls than the baseline by more than --threshold.
+import itertools
+import json
+import optparse
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+MEAN,SIGMA,L,A,B=250.,50.,100.,0.,3000.
+
+def _events(n,seed=1):
+    import SignalBackground
+    sig=max(1.,n/6)
+    return SignalBackground.sample(np.random.default_rng(seed),int(n),MEAN,SIGMA,L,sig,n-sig,a=A,b=B)
+
+def _truth(n):
+    sig=max(1.,n/6)
+    return (MEAN,SIGMA,L,sig,n-sig)
+
+#points around start where the costs are evaluated: each call of the benchmark uses new ones, so caches of the costs don't hide the evaluation time
+def _points(start,calls,counter):
+    k=next(counter)
+    return [np.asarray(start)*(1+1e-6*(k*calls+i+1)) for i in range(calls)]
+
+#polynomial of any number of parameters, for the least squares benchmarks
+def polynomial_model(x,*p):
+    return np.polyval(p[::-1],x)
+
+#extended likelihood of the whole sample as one function, the form used with Minimization.extendednll
+def sb_extended(x,mean,sigma,l,sig,bkg):
+    import SignalBackground
+    return 2*(sig+bkg)-2*np.sum(np.log(SignalBackground.sb_density(x,mean,sigma,l,sig,bkg,A,B)))
+
+def _minuit_fit(cost,start,limits=None):
+    from iminuit import Minuit
+    m=Minuit(cost,*start)
+    if limits is not None:
+        m.limits=limits
+    m.migrad()
+    return m
+
+#Every benchmark takes the events, the number of parameters and the number of workers, and returns a function doing one run,
+#which returns a dictionary with the number of items processed ("events" or "fits") and optionally the nfcn of the fits.
+
+def bench_leastsquares(n,npar,workers,calls=20):
+    import Minimization
+    x=np.linspace(-1,1,n)
+    y=polynomial_model(x,*np.ones(npar))+np.random.default_rng(1).normal(0,0.1,n)
+    cost=Minimization.leastsquares(polynomial_model,x,y,np.full(n,0.1))
+    counter=itertools.count()
+    def run():
+        for p in _points(np.ones(npar),calls,counter):
+            cost(*p)
+        return {"events":n*calls}
+    return run
+
+def bench_leastsquares_fit(n,npar,workers):
+    import Minimization
+    x=np.linspace(-1,1,n)
+    y=polynomial_model(x,*np.ones(npar))+np.random.default_rng(1).normal(0,0.1,n)
+    cost=Minimization.leastsquares(polynomial_model,x,y,np.full(n,0.1))
+    def run():
+        m=_minuit_fit(cost,np.full(npar,0.5))
+        return {"fits":1,"nfcn":m.nfcn}
+    return run
+
+def bench_nll(n,npar,workers,calls=2):
+    import Minimization
+    x=np.random.default_rng(1).normal(0,1,n)
+    cost=Minimization.nll(Minimization.gaussian_model,x)
+    counter=itertools.count()
+    def run():
+        for p in _points((0.1,1.1),calls,counter):
+            cost(*p)
+        return {"events":n*calls}
+    return run
+
+def bench_batchnll(n,npar,workers,calls=20):
+    import Minimization
+    x=np.random.default_rng(1).normal(0,1,n)
+    cost=Minimization.batchnll(Minimization.gaussian_model,x)
+    counter=itertools.count()
+    def run():
+        for p in _points((0.1,1.1),calls,counter):
+            cost(*p)
+        return {"events":n*calls}
+    return run
+
+#gaussian fit from the sufficient statistics: the time should not depend on the number of events
+def bench_compressednll_fit(n,npar,workers):
+    import Minimization
+    x=np.random.default_rng(1).normal(0,1,n)
+    def run():
+        m=_minuit_fit(Minimization.compressednll(Minimization.gaussian_model,x),(0.1,1.2))
+        m.hesse()
+        return {"fits":1,"nfcn":m.nfcn}
+    return run
+
+def bench_extendednll(n,npar,workers,calls=20):
+    import Minimization
+    cost=Minimization.extendednll(sb_extended,_events(n))
+    counter=itertools.count()
+    def run():
+        for p in _points(_truth(n),calls,counter):
+            cost(*p)
+        return {"events":n*calls}
+    return run
+
+def bench_sbextendednll(n,npar,workers,calls=20):
+    import SignalBackground
+    cost=SignalBackground.sbextendednll(_events(n),a=A,b=B)
+    counter=itertools.count()
+    def run():
+        for p in _points(_truth(n),calls,counter):
+            cost(*p)
+        return {"events":n*calls}
+    return run
+
+def bench_sbextendednll_fit(n,npar,workers):
+    import SignalBackground
+    cost=SignalBackground.sbextendednll(_events(n),a=A,b=B)
+    start=np.array(_truth(n))*(1.1,1.2,0.9,0.8,1.05)
+    def run():
+        m=_minuit_fit(cost,start,limits=[(A,B),(1,None),(1,None),(0,None),(0,None)])
+        return {"fits":1,"nfcn":m.nfcn}
+    return run
+
+#one migrad with the events evaluated in chunks in workers threads
+def bench_sbextendednll_threads(n,npar,workers):
+    import SignalBackground
+    cost=SignalBackground.sbextendednll(_events(n),a=A,b=B,threads=workers)
+    start=np.array(_truth(n))*(1.1,1.2,0.9,0.8,1.05)
+    def run():
+        cost.cache.clear()
+        m=_minuit_fit(cost,start,limits=[(A,B),(1,None),(1,None),(0,None),(0,None)])
+        return {"fits":1,"nfcn":m.nfcn}
+    return run
+
+def bench_sbbinnednll_fit(n,npar,workers):
+    import SignalBackground
+    cost=SignalBackground.sbbinnednll(_events(n),bins=100,a=A,b=B)
+    start=np.array(_truth(n))*(1.1,1.2,0.9,0.8,1.05)
+    def run():
+        m=_minuit_fit(cost,start,limits=[(A,B),(1,None),(1,None),(0,None),(0,None)])
+        return {"fits":1,"nfcn":m.nfcn}
+    return run
+
+def bench_sum_function_pdf(n,npar,workers,calls=20):
+    import Generation
+    f=Generation.sum_function(a=A,b=B)
+    f.set_pars(*_truth(n))
+    x=np.linspace(A,B,n)
+    def run():
+        for i in range(calls):
+            f._pdf(x)
+        return {"events":n*calls}
+    return run
+
+#scipy inverts the cdf numerically for every event: this is the reason Generation uses SignalBackground.sample
+def bench_sum_function_rvs(n,npar,workers):
+    import Generation
+    f=Generation.sum_function(a=A,b=B)
+    f.set_pars(*_truth(n))
+    def run():
+        f.rvs(size=n,random_state=1)
+        return {"events":n}
+    return run
+
+def bench_sample(n,npar,workers):
+    import SignalBackground
+    rng=np.random.default_rng(1)
+    def run():
+        SignalBackground.sample(rng,n,*_truth(n),a=A,b=B)
+        return {"events":n}
+    return run
+
+#the whole Generation script, writing the event file and the histogram in a temporary directory
+def bench_generation(n,npar,workers):
+    import Generation
+    sig=int(max(1,n/6))
+    def run():
+        cwd=os.getcwd()
+        with tempfile.TemporaryDirectory() as d:
+            os.chdir(d)
+            try:
+                Generation.main(["Generation.py",str(sig),str(int(n)-sig),"1"])
+            finally:
+                os.chdir(cwd)
+        return {"events":n}
+    return run
+
+def bench_profile(n,npar,workers):
+    import SignalBackground
+    import Profiles
+    cost=SignalBackground.sbextendednll(_events(n),a=A,b=B)
+    m=_minuit_fit(cost,_truth(n))
+    m.hesse()
+    def run():
+        scanner=Profiles.profilescanner(m,cost,workers=workers)
+        x,y=scanner.profile("sig",size=20)
+        return {"fits":len(x)}
+    return run
+
+def bench_asymptotic_limit(n,npar,workers):
+    import Limits
+    events=_events(n)
+    start=(MEAN,SIGMA,L,10.,max(n-10.,1.))
+    def run():
+        calc=Limits.asymptoticcls(events,start=start,fixed=("mean","sigma"),a=A,b=B)
+        calc.upper_limit(0.95)
+        #the fits to the data and to the Asimov dataset, unconditional and at every sig tried
+        return {"fits":2+2*len(calc.qs)}
+    return run
+
+def bench_toys(n,npar,workers,ntoys=40):
+    import SignalBackground
+    import Toys
+    truth=_truth(n)
+    def run():
+        Toys.run_toys(SignalBackground.sbextendednll,_sb_generator(n),truth,ntoys,seed=1,workers=workers)
+        return {"fits":ntoys}
+    return run
+
+#picklable generator for the toys: Toys.run_toys may send it to other processes
+class _sb_generator:
+    def __init__(self,n):
+        self.n=n
+    def __call__(self,rng):
+        import SignalBackground
+        truth=_truth(self.n)
+        return SignalBackground.sample(rng,rng.poisson(truth[3])+rng.poisson(truth[4]),*truth,a=A,b=B)
+
+#name: (function, parameters it depends on, largest number of events it is run with)
+BENCHMARKS={
+    "leastsquares":(bench_leastsquares,("events","npar"),10**7),
+    "leastsquares_fit":(bench_leastsquares_fit,("events","npar"),10**6),
+    "nll":(bench_nll,("events",),10**5),
+    "batchnll":(bench_batchnll,("events",),10**7),
+    "compressednll_fit":(bench_compressednll_fit,("events",),10**7),
+    "extendednll":(bench_extendednll,("events",),10**7),
+    "sbextendednll":(bench_sbextendednll,("events",),10**7),
+    "sbextendednll_fit":(bench_sbextendednll_fit,("events",),10**6),
+    "sbextendednll_threads":(bench_sbextendednll_threads,("events","workers"),10**8),
+    "sbbinnednll_fit":(bench_sbbinnednll_fit,("events",),10**7),
+    "sum_function_pdf":(bench_sum_function_pdf,("events",),10**7),
+    "sum_function_rvs":(bench_sum_function_rvs,("events",),10**3),
+    "sample":(bench_sample,("events",),10**7),
+    "generation":(bench_generation,("events",),10**7),
+    "profile":(bench_profile,("events","workers"),10**5),
+    "asymptotic_limit":(bench_asymptotic_limit,("events",),10**6),
+    "toys":(bench_toys,("events","workers"),10**4),
+}
+
+#Startup of the short batch jobs: seconds allowed to import each module in a new interpreter,
+#and the heavy modules that must not be imported with it (they are imported by the functions that need them)
+HEAVY=("matplotlib","scipy.stats","scipy.optimize","iminuit")
+IMPORT_BUDGETS={
+    "EventFiles":(0.5,HEAVY),
+    "Minimization":(0.5,HEAVY),
+    "SignalBackground":(1.,HEAVY),
+    "Generation":(1.,HEAVY),
+    "Plotting":(0.1,HEAVY),
+    "Toys":(1.,("matplotlib","scipy.stats","scipy.optimize")),
+}
+
+#best time of repeat imports of module, each in a new interpreter, and the modules it imported
+def import_time(module,repeat):
+    code="import sys,time\nt=time.perf_counter()\nimport "+module+"\nprint(time.perf_counter()-t)\nprint(' '.join(sys.modules))"
+    times=[]
+    for i in range(max(repeat,1)):
+        out=subprocess.run([sys.executable,"-c",code],cwd=os.path.dirname(os.path.abspath(__file__)),
+                           stdout=subprocess.PIPE,check=True,universal_newlines=True).stdout.split("\n")
+        times.append(float(out[0]))
+    return min(times),set(out[1].split())
+
+#Returns the results, in the same form as run_all, and the list of failures
+def check_imports(repeat):
+    results={}
+    failures=[]
+    for module,(budget,forbidden) in IMPORT_BUDGETS.items():
+        seconds,modules=import_time(module,repeat)
+        heavy=[m for m in forbidden if m in modules]
+        key=label("import",{"module":module})
+        results[key]={"seconds":seconds,"throughput":None,"unit":None,"peak_memory":None,"nfcn":None,"benchmark":"import","module":module}
+        print("%-50s %10.4f s   budget %.2f s   heavy modules: %s"%(key,seconds,budget,",".join(heavy) or "none"))
+        if seconds>budget:
+            failures.append("%s takes %.3f s to import, the budget is %.2f s"%(module,seconds,budget))
+        if heavy:
+            failures.append("%s imports %s"%(module,",".join(heavy)))
+    return results,failures
+
+#The fast paths must still give the right answers: edge cases compared with the obvious loops.
+#Returns the list of failures.
+def check_results():
+    import Toys
+    failures=[]
+    #empty toys at the start, in the middle and at the end
+    for data,offsets in (([1.,2.,3.],[0,3,3]),([1.,2.,3.],[0,0,2,2,3,3]),([],[0,0,0]),([5.],[0,1])):
+        toys=Toys.raggedtoys(np.array(data),np.array(offsets))
+        expected=[float(np.sum(t)) for t in toys]
+        if not np.array_equal(toys.sums(),expected):
+            failures.append("raggedtoys(%s,%s).sums() is %s instead of %s"%(data,offsets,list(toys.sums()),expected))
+    #models that differ only in an attribute (np.sum and np.mean), directly or in a function defined inside them,
+    #must not share a FitCache key. They are made with exec so that they have the same name (and no __module__).
+    import FitCache
+    sources=("def model(x):\n    return np.%s(x)\n",
+             "def model(x):\n    def inner(y):\n        return np.%s(y)\n    return inner(x)\n")
+    for source in sources:
+        keys=[]
+        for reduction in ("sum","mean"):
+            variables={"np":np}
+            exec(source%reduction,variables)
+            keys.append(FitCache.fingerprint(variables["model"]))
+        if keys[0]==keys[1]:
+            failures.append("FitCache gives the same key to models with np.sum and np.mean:\n"+source%"sum")
+    return failures
+
+def label(name,point):
+    return name+"["+",".join(k+"="+str(v) for k,v in point.items())+"]"
+
+#Run one benchmark: a first run warms up (lazy imports, caches of the code), the second is traced for the peak memory,
+#and the time is the best of the next repeat runs
+def measure(run,repeat):
+    run()
+    tracemalloc.start()
+    counts=run()
+    peak=tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times=[]
+    for i in range(repeat):
+        t0=time.perf_counter()
+        counts=run()
+        times.append(time.perf_counter()-t0)
+    seconds=min(times)
+    unit="fits" if "fits" in counts else "events"
+    return {"seconds":seconds,"throughput":counts[unit]/seconds,"unit":unit+"/s","peak_memory":peak,"nfcn":counts.get("nfcn")}
+
+def run_all(names,events,npars,workers,repeat):
+    results={}
+    for name in names:
+        function,axes,maxevents=BENCHMARKS[name]
+        values={"events":[n for n in events if n<=maxevents],"npar":npars if "npar" in axes else [None],
+                "workers":workers if "workers" in axes else [1]}
+        for n,npar,w in itertools.product(values["events"],values["npar"],values["workers"]):
+            point={"events":n}
+            if npar is not None:
+                point["npar"]=npar
+            if "workers" in axes:
+                point["workers"]=w
+            key=label(name,point)
+            result=measure(function(n,npar,w),repeat)
+            results[key]=dict(result,benchmark=name,**point)
+            print("%-50s %10.4f s %12.4g %-9s %10.1f MB  nfcn %s"%(key,result["seconds"],result["throughput"],result["unit"],
+                                                                result["peak_memory"]/2**20,result["nfcn"]))
+            sys.stdout.flush()
+    return results
+
+def environment():
+    import scipy
+    import iminuit
+    return {"python":platform.python_version(),"machine":platform.machine(),"processor":platform.processor(),"cpus":os.cpu_count(),
+            "numpy":np.__version__,"scipy":scipy.__version__,"iminuit":iminuit.__version__,"time":time.strftime("%Y-%m-%d %H:%M:%S")}
+
+#differences of peak memory smaller than this are not regressions: small allocations of numpy and iminuit vary from run to run
+MEMORY_NOISE=2**20
+
+#Benchmarks present in both runs whose time, peak memory or nfcn grew by more than threshold (as a fraction)
+def compare(results,baseline,threshold):
+    regressions=[]
+    for key,new in results.items():
+        old=baseline["results"].get(key)
+        if old is None:
+            continue
+        for quantity in ("seconds","peak_memory","nfcn"):
+            if new.get(quantity) is None or not old.get(quantity):
+                continue
+            ratio=new[quantity]/old[quantity]
+            if quantity=="peak_memory" and new[quantity]-old[quantity]<MEMORY_NOISE:
+                continue
+            if ratio>1+threshold:
+                regressions.append((key,quantity,old[quantity],new[quantity],ratio))
+    return regressions
+
+def _numbers(option,opt,value,parser):
+    setattr(parser.values,option.dest,[int(float(v)) for v in value.split(",")])
+
+def main(argv):
+    parser=optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--events",type="string",action="callback",callback=_numbers,dest="events",default=[10**3,10**4,10**5,10**6],
+                      help="comma separated numbers of events, e.g. 1e3,1e5,1e7 [default: 1e3 to 1e6]")
+    parser.add_option("--npars",type="string",action="callback",callback=_numbers,dest="npars",default=[2,8],
+                      help="comma separated numbers of parameters of the least squares benchmarks [default: 2,8]")
+    parser.add_option("--workers",type="string",action="callback",callback=_numbers,dest="workers",default=[1,4],
+                      help="comma separated numbers of worker processes [default: 1,4]")
+    parser.add_option("--only",type="string",default=None,help="comma separated benchmarks to run, out of: "+",".join(BENCHMARKS))
+    parser.add_option("--repeat",type="int",default=3,help="timed runs of each benchmark, the best is kept [default: %default]")
+    parser.add_option("--no-imports",action="store_false",dest="imports",default=True,help="don't check the import time budgets")
+    parser.add_option("--output",type="string",default=None,help="save the results to this json file, to use as baseline")
+    parser.add_option("--compare",type="string",default=None,help="json file of an earlier run to compare with")
+    parser.add_option("--threshold",type="float",default=0.2,help="allowed relative increase before failing [default: %default]")
+    options,args=parser.parse_args(argv[1:])
+
+    names=list(BENCHMARKS) if options.only is None else options.only.split(",")
+    for name in names:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark "+name)
+
+    results={}
+    failures=check_results()
+    if options.imports:
+        results,import_failures=check_imports(options.repeat)
+        failures.extend(import_failures)
+    results.update(run_all(names,options.events,options.npars,options.workers,options.repeat))
+    if options.output is not None:
+        with open(options.output,"w") as f:
+            json.dump({"environment":environment(),"results":results},f,indent=1)
+        print("results saved in",options.output)
+
+    if options.compare is not None:
+        with open(options.compare) as f:
+            baseline=json.load(f)
+        regressions=compare(results,baseline,options.threshold)
+        for key,quantity,old,new,ratio in regressions:
+            failures.append("REGRESSION %s %s: %.4g -> %.4g (x%.2f)"%(key,quantity,old,new,ratio))
+        if not regressions:
+            print("no regressions above %g%% with respect to %s"%(100*options.threshold,options.compare))
+
+    for failure in failures:
+        print("FAILED",failure)
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,84 @@
+#Binary event files: a fixed size header with the metadata in json, followed by the events as raw little-endian float64.
+#The events can be appended in chunks while generating, and are read back with a memory map, without copying them.
+#The text format (one number per line) is still supported for old files.
+import json
+import os
+import numpy as np
+
+MAGIC=b"STATEVT1"
+HEADER_SIZE=4096#bytes: the events start here, aligned for the memory map
+DTYPE=np.dtype("<f8")
+
+class eventwriter:
+    def __init__(self,path,metadata=None):
+        self.path=path
+        self.metadata=dict(metadata or {})
+        self.nevents=0
+        self.f=open(path,"wb")
+        self._write_header(complete=False)
+    def append(self,events):
+        events=np.ascontiguousarray(events,dtype=DTYPE)
+        self.f.write(events.tobytes())
+        self.nevents+=len(events)
+    #the header is written again at the end with the number of events, which is used to check the file is complete.
+    #complete=False (e.g. the writer was interrupted) records the events written so far without marking the file complete.
+    def close(self,complete=True):
+        if self.f.closed:
+            return
+        self._write_header(complete=complete)
+        self.f.close()
+    def _write_header(self,complete):
+        header=dict(self.metadata,nevents=self.nevents,complete=complete)
+        text=json.dumps(header).encode("utf-8")
+        if len(MAGIC)+len(text)+1>HEADER_SIZE:
+            raise ValueError("metadata too large for the event file header")
+        position=self.f.tell()
+        self.f.seek(0)
+        self.f.write(MAGIC+text+b"\n"+b" "*(HEADER_SIZE-len(MAGIC)-len(text)-1))
+        self.f.seek(max(position,HEADER_SIZE))
+    def __enter__(self):
+        return self
+    def __exit__(self,*exc):
+        self.close(complete=exc[0] is None)
+
+def write_events(path,events,metadata=None):
+    with eventwriter(path,metadata) as w:
+        w.append(events)
+
+def read_metadata(path):
+    with open(path,"rb") as f:
+        header=f.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(path+" is not a binary event file")
+    return json.loads(header[len(MAGIC):].split(b"\n",1)[0])
+
+#The metadata if path is a binary event file that was closed properly and has all its events, otherwise None
+#(e.g. the file does not exist, or the job writing it was killed)
+def complete_metadata(path):
+    try:
+        metadata=read_metadata(path)
+    except (OSError,ValueError):
+        return None
+    if not metadata.get("complete") or os.path.getsize(path)!=HEADER_SIZE+metadata["nevents"]*DTYPE.itemsize:
+        return None
+    return metadata
+
+#Events between start and stop as a read-only memory map. The number of events is taken from the file size,
+#so a file that is still being written can be read up to the last complete event.
+def read_events(path,start=0,stop=None):
+    read_metadata(path)#checks the format
+    nevents=(os.path.getsize(path)-HEADER_SIZE)//DTYPE.itemsize
+    stop=nevents if stop is None else min(stop,nevents)
+    if stop<=start:
+        return np.empty(0,dtype=DTYPE)
+    return np.memmap(path,dtype=DTYPE,mode="r",offset=HEADER_SIZE+start*DTYPE.itemsize,shape=(stop-start,))
+
+#Legacy text format: one event per line
+def read_text_events(path):
+    return np.loadtxt(path,dtype=np.float64,ndmin=1)
+
+#Read either format, deciding from the file extension
+def load_events(path):
+    if path.endswith(".txt"):
+        return read_text_events(path)
+    return read_events(path)
@@ -1,15 +1,13 @@
-import Minimization
 from iminuit import Minuit
-from scipy.stats import norm
-from scipy.optimize import minimize
 from scipy.stats import rv_continuous,poisson
-from iminuit.util import describe, make_func_code
 import numpy as np
-import math,sys
-import matplotlib.pyplot as plt
-import Minimization
-print (Minimization.chi2)
-import optparse
+import sys,os
+import Plotting
+import SignalBackground
+import EventFiles
+import Profiles
+import Instrumentation
+import MultiStart
 
 #I give you the model:
 
@@ -35,12 +33,13 @@ def main(argv):
 
     postfix=""
     if(len(argv)>1):postfix = argv[1]
-    fin = open("generated_events"+str(postfix)+".txt","r")
-    numlist=[]
-    for l in fin.readlines():
-        numlist.append(float(l))
+    #binary event file written by Generation, or the old text format if that is all we have
+    filename="generated_events"+str(postfix)+".evt"
+    if not os.path.exists(filename):
+        filename="generated_events"+str(postfix)+".txt"
+    numlist=EventFiles.load_events(filename)
 
-    print(numlist)
+    print("read",len(numlist),"events from",filename)
 
 
     #2.1 let's write the likelihood by hand:
@@ -86,8 +85,6 @@ def main(argv):
         for xi in x:
             negll+=-2*np.log(sum_pdf.pdf(xi))
         p=-2*np.log(pois.pmf(len(x)))+negll
-        p=p+negll
-        print("nll",p,"pars",mean,sigma,l,sig,bkg)
         return p
 
     #what is the correct function to use? nl or chi2? A: neither!!!! 
@@ -97,42 +94,75 @@ def main(argv):
     exnll = extendednll(extendedNLLfunction,numlist)
 
     print(exnll(mean,sigma,l,s,b))
-    
+
+    #extendedNLLfunction is fine to understand what happens, but it creates new objects and loops over the events at every call.
+    #For the fit we use the same likelihood written in closed form and evaluated on all events at once.
+    #The parameters are called mean, sigma, l, sig, bkg
+    #with STATMETHODS_INSTRUMENT set, the calls of the cost are counted and timed (see Instrumentation)
+    exnll = Instrumentation.instrument(SignalBackground.sbextendednll(numlist,a=0.,b=3000.))
+    print(exnll(mean,sigma,l,s,b))
 
     m3=Minuit(exnll,mean,sigma,l,s,b)
     for e in range(len(m3.errors)):
         m3.errors[e]=m3.values[e]*0.3
     
     print(Minuit.LEAST_SQUARES)
-    m3.errordef=Minuit.LIKELIHOOD
+    #no need to set m3.errordef: it is taken from exnll.errordef, which is 1 because the cost is -2 log L
     m3.strategy= 0
     m3.scan()
 #    m3.strategy= 1
 #    m3.scan()
     
-    fig, ax = plt.subplots(1, 1)
-    
-    m3.draw_profile("x3")
-    m3.draw_profile("x4")
+    #the plots are optional (STATMETHODS_PLOTS=0 skips them) and are only saved to files
+    plots=Plotting.enabled()
+    if plots:
+        plt=Plotting.pyplot()
+        fig, ax = plt.subplots(1, 1)
+        
+        m3.draw_profile("sig")
+        m3.draw_profile("bkg")
 
-    plt.savefig("simplescanplot+"+postfix+".png")
-    prof3x,prof3y=m3.profile("x3")
-    prof4x,prof4y=m3.profile("x4")
+        plt.savefig("simplescanplot+"+postfix+".png")
+    prof3x,prof3y=m3.profile("sig")
+    prof4x,prof4y=m3.profile("bkg")
     print(m3.params, m3.values, m3.errors,m3.covariance)
 
 
     m3.strategy= 2
     m3.migrad()
     print(m3.params, m3.values, m3.errors,m3.covariance)
-
-    m3.draw_profile("x3")
-    m3.draw_profile("x4")
-    plt.savefig("migrad_both"+postfix+".png")
-
-    plt.clf()
-    m3.draw_profile("x3")
-    m3.draw_profile("x4")
-    plt.savefig("migrad_only"+postfix+".png")
+    Instrumentation.report(exnll,"instrumentation"+postfix+".json")
+
+    #The scan above is there to find a good starting point for migrad. The multi-start driver does the same more reliably:
+    #starting points spread over the limits, cheap migrads from each of them, and the best minima polished at strategy 2
+    nevents=len(numlist)
+    multi=MultiStart.multistart(exnll,[(0.,3000.),(1.,1000.),(1.,1000.),(0.,nevents),(0.,2.*nevents)],seed=1)
+    print("multi-start:",multi["starts"],"starts,",len(multi["basins"]),"different minima, best",multi["minuit"].fval,"with",multi["minuit"].values)
+    print("migrad after the scan found",m3.fval)
+
+    #after migrad we look at the profile likelihood: at each value of sig (or bkg) all the other parameters are minimized again.
+    #The scanner keeps the profiles of this minimum, so drawing them a second time does not repeat the scan
+    profiles=Profiles.profilescanner(m3,exnll)
+    if plots:
+        profiles.draw("sig")
+        profiles.draw("bkg")
+        plt.savefig("migrad_both"+postfix+".png")
+
+        plt.clf()
+        profiles.draw("sig")
+        profiles.draw("bkg")
+        plt.savefig("migrad_only"+postfix+".png")
+    print("68% interval on sig from the profile likelihood",profiles.interval("sig",1.))
+    print("95% interval on sig from the profile likelihood",profiles.interval("sig",3.84))
+    #MINOS intervals of all the parameters, and the contour of sig and bkg, each computed in its own process
+    merrors,contours=Profiles.minos_and_contours(m3,exnll,pairs=[("sig","bkg")])
+    print(merrors)
+    if plots:
+        plt.clf()
+        plt.plot(*contours[("sig","bkg")].T)
+        plt.xlabel("sig")
+        plt.ylabel("bkg")
+        plt.savefig("contour_sig_bkg"+postfix+".png")
 
     print(prof3x,prof3y)
     print("\n\n\n")
@@ -141,6 +171,12 @@ def main(argv):
     #2.3 exercise: how about a binned maximum likelihood?
 
     #We need to merge together the bins:
+    #the events are filled in a histogram once, and the expected events in each bin are the model integrated over the bin.
+    #The likelihood is the product of the poisson probabilities of each bin: its cost does not depend on the number of events
+    binnednll = SignalBackground.sbbinnednll(numlist,bins=100,a=0.,b=3000.)
+    m4=Minuit(binnednll,*m3.values)#we start from the unbinned minimum, the binned one should be close
+    m4.migrad()
+    print("binned fit",m4.params)
 
     #2.4 what if I want to extract an upper limit for s?  
 
@@ -0,0 +1,200 @@
+#Cache on disk of fit results, so that running a study again (e.g. after changing a plot) does not repeat the same fits.
+#The key is a hash of everything that determines the result: the data and settings stored in the cost function, the model
+#(the code of its classes and functions, and the closure variables and globals they use), the starting values, limits,
+#fixed parameters and minimizer settings. Results are kept in one .npz file per key; when the directory grows above maxsize
+#bytes the least recently used are removed, down to LOW_WATER*maxsize so that the directory is not listed at every put.
+#Several processes can share a directory: an entry that another process removed in the meantime is simply a miss.
+import hashlib
+import json
+import os
+import types
+import numpy as np
+
+LOW_WATER=0.8
+DEFAULT_DIRECTORY=os.environ.get("STATMETHODS_FIT_CACHE",os.path.join(os.path.expanduser("~"),".cache","statmethods","fits"))
+
+#Feed obj into the hash h. Attributes called "cache" (e.g. SignalBackground.shapecache) are skipped:
+#they only make the evaluation faster and don't change the result.
+def _update(h,obj,seen):
+    if isinstance(obj,np.ndarray):
+        h.update(b"array"+str(obj.dtype).encode()+str(obj.shape).encode())
+        h.update(np.ascontiguousarray(obj).tobytes())
+    elif obj is None or isinstance(obj,(bool,int,float,complex,np.number)):
+        h.update(repr(obj).encode())
+    elif isinstance(obj,str):
+        h.update(b"str"+obj.encode())
+        if os.path.isfile(obj):#a file name, e.g. the source of Minimization.streamingnll: its content can change
+            stat=os.stat(obj)
+            h.update(repr((stat.st_size,stat.st_mtime_ns)).encode())
+    elif isinstance(obj,(list,tuple)):
+        h.update(b"list")
+        for o in obj:
+            _update(h,o,seen)
+    elif isinstance(obj,dict):
+        h.update(b"dict")
+        for k in sorted(obj,key=str):
+            if k=="cache":
+                continue
+            _update(h,k,seen)
+            _update(h,obj[k],seen)
+    elif id(obj) in seen:#e.g. a bound method of the cost stored in the cost itself
+        h.update(b"seen")
+    elif hasattr(obj,"__func__") and hasattr(obj,"__self__"):#bound method
+        seen.add(id(obj))
+        _update(h,obj.__func__,seen)
+        _update(h,obj.__self__,seen)
+    elif hasattr(obj,"__code__"):#function: its name and its code, so that changing the model changes the key
+        seen.add(id(obj))
+        h.update(((obj.__module__ or "")+"."+obj.__qualname__).encode())
+        _update_code(h,obj.__code__,seen)
+        _update(h,obj.__defaults__,seen)
+        _update(h,obj.__kwdefaults__,seen)
+        #the values it uses that are not in its code: the variables of a closure and the globals it reads
+        _update(h,[_cell_contents(c) for c in obj.__closure__ or ()],seen)
+        variables=getattr(obj,"__globals__",{})
+        _update(h,[(n,variables[n]) for n in _code_names(obj.__code__) if n in variables],seen)
+    elif isinstance(obj,types.ModuleType):#e.g. np in the globals of a function: its name only
+        h.update(b"module"+obj.__name__.encode())
+    elif isinstance(obj,type):
+        h.update((obj.__module__+"."+obj.__qualname__).encode())
+    elif hasattr(obj,"__dict__"):
+        seen.add(id(obj))
+        #the class and the code of its methods, then the attributes of the object
+        for cls in type(obj).__mro__[:-1]:
+            _update(h,cls,seen)
+            _update(h,[f for name,f in sorted(vars(cls).items()) if hasattr(f,"__code__")],seen)
+        _update(h,vars(obj),seen)
+    else:
+        h.update(repr(obj).encode())
+
+#The bytecode, the names (globals and attributes: np.sum and np.mean differ only there) and the constants of a code object,
+#with those of the functions defined inside it (e.g. the partial sums of SignalBackground.sbextendednll.__call__)
+def _update_code(h,code,seen):
+    h.update(b"code"+code.co_code)
+    h.update(" ".join(code.co_names).encode())
+    for c in code.co_consts:
+        if hasattr(c,"co_code"):
+            _update_code(h,c,seen)
+        else:
+            _update(h,c,seen)
+
+#co_names of code and of the code objects nested in it
+def _code_names(code):
+    names=list(code.co_names)
+    for c in code.co_consts:
+        if hasattr(c,"co_code"):
+            names.extend(n for n in _code_names(c) if n not in names)
+    return names
+
+def _cell_contents(cell):
+    try:
+        return cell.cell_contents
+    except ValueError:#empty cell: a variable of the enclosing function that is not assigned yet
+        return "empty cell"
+
+def fingerprint(*objects):
+    h=hashlib.sha256()
+    _update(h,objects,set())
+    return h.hexdigest()
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:#already removed by another process
+        pass
+
+class fitcache:
+    def __init__(self,directory=DEFAULT_DIRECTORY,maxsize=2**30):
+        self.directory=directory
+        self.maxsize=maxsize
+        self.size=None#total size of the entries at the last listing of the directory, plus those put since
+        os.makedirs(directory,exist_ok=True)
+
+    def key(self,cost,start,**settings):
+        import iminuit
+        return fingerprint(cost,np.asarray(start,dtype=np.float64),settings,iminuit.__version__)
+
+    def path(self,key):
+        return os.path.join(self.directory,key+".npz")
+
+    #the stored result, or None; reading it marks it as recently used
+    def get(self,key):
+        path=self.path(key)
+        try:
+            with np.load(path) as f:
+                result={k:f[k] for k in f.files}
+        except (OSError,ValueError,KeyError):
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:#removed by another process after it was read
+            pass
+        result["parameters"]=json.loads(str(result["parameters"]))
+        for k in ("fval","valid","nfcn"):
+            result[k]=result[k].item()
+        return result
+
+    def put(self,key,result):
+        path=self.path(key)
+        tmp=path+".tmp"+str(os.getpid())
+        stored=dict(result)
+        stored["parameters"]=json.dumps(list(stored["parameters"]))
+        with open(tmp,"wb") as f:
+            np.savez(f,**stored)
+        size=os.path.getsize(tmp)
+        os.replace(tmp,path)#atomic: other processes never see a half written file
+        if self.size is None or self.size+size>self.maxsize:
+            self.evict()
+        else:
+            self.size+=size
+
+    #remove one entry, or all of them if key is None
+    def invalidate(self,key=None):
+        self.size=None
+        names=[key+".npz"] if key is not None else [n for n in os.listdir(self.directory) if n.endswith(".npz")]
+        for name in names:
+            _remove(os.path.join(self.directory,name))
+
+    #if the entries take more than maxsize, remove the least recently used ones until they take LOW_WATER*maxsize
+    def evict(self):
+        entries=[]
+        for name in os.listdir(self.directory):
+            if name.endswith(".npz"):
+                try:
+                    stat=os.stat(os.path.join(self.directory,name))
+                except FileNotFoundError:#removed by another process
+                    continue
+                entries.append((stat.st_mtime,stat.st_size,name))
+        total=sum(e[1] for e in entries)
+        if total>self.maxsize:
+            for mtime,size,name in sorted(entries):
+                if total<=LOW_WATER*self.maxsize:
+                    break
+                _remove(os.path.join(self.directory,name))
+                total-=size
+        self.size=total
+
+    #Fit with migrad and hesse, or take the result from the cache if the same fit was done before.
+    #Returns values, errors, covariance, fval (the minimum), valid, nfcn, the parameter names and whether it was cached.
+    def fit(self,cost,start,limits=None,fixed=None,strategy=1,nmigrad=1,refresh=False):
+        key=self.key(cost,start,limits=limits,fixed=fixed,strategy=strategy,nmigrad=nmigrad,method="migrad+hesse")
+        result=None if refresh else self.get(key)
+        if result is not None:
+            result["cached"]=True
+            return result
+        from iminuit import Minuit
+        m=Minuit(cost,*start)
+        if limits is not None:
+            m.limits=limits
+        if fixed is not None:
+            m.fixed=fixed
+        m.strategy=strategy
+        for i in range(nmigrad):
+            m.migrad()
+        m.hesse()
+        covariance=np.array(m.covariance) if m.covariance is not None else np.full((m.npar,m.npar),np.nan)
+        result={"values":np.array(m.values),"errors":np.array(m.errors),"covariance":covariance,
+                "fval":m.fval,"valid":m.valid,"nfcn":m.nfcn,"parameters":list(m.parameters)}
+        self.put(key,result)
+        result["cached"]=False
+        return result
@@ -1,45 +1,70 @@
-import Minimization
-from iminuit import Minuit
-from scipy.stats import norm
-from scipy.optimize import minimize
-from scipy.stats import rv_continuous,poisson
-from iminuit.util import describe, make_func_code
+#Only what the generation needs is imported here: we run many short generation jobs, and scipy.stats, iminuit
+#and matplotlib would take longer to import than generating the events. matplotlib is imported only to plot (see Plotting).
+import SignalBackground
+import EventFiles
+import Plotting
 import numpy as np
-import math,sys
-import matplotlib.pyplot as plt
+import functools
+import itertools
+import sys,os
 
-class sum_function(rv_continuous):
-    
-    def set_pars(self,mean,sigma,l,sig,bkg):
-        self.mean=mean
-        self.sigma=sigma
-        self.l=l
-        self.sig=sig
-        self.bkg=bkg
-    
-    def _pdf(self, x):
-        sigpdf = np.exp(-(x-self.mean)**2 / (2.*self.sigma**2)) / (self.sigma*np.sqrt(2.0 * np.pi))
-        bkgpdf = 1/self.l*np.exp(-(x/self.l) )
+#sum_function(a=...,b=...) makes a distribution of the class below, created the first time it is needed
+def sum_function(*args,**kwargs):
+    return _sum_function_class()(*args,**kwargs)
 
+@functools.lru_cache(maxsize=None)
+def _sum_function_class():
+    from scipy.stats import rv_continuous
+    class sum_function(rv_continuous):
         
-        f1=self.sig/(self.sig+self.bkg) 
-        f2=self.bkg/(self.sig+self.bkg)
+        def set_pars(self,mean,sigma,l,sig,bkg):
+            self.mean=mean
+            self.sigma=sigma
+            self.l=l
+            self.sig=sig
+            self.bkg=bkg
         
-        return f1*sigpdf+f2*bkgpdf
+        def _pdf(self, x):
+            sigpdf = np.exp(-(x-self.mean)**2 / (2.*self.sigma**2)) / (self.sigma*np.sqrt(2.0 * np.pi))
+            bkgpdf = 1/self.l*np.exp(-(x/self.l) )
+
+            
+            f1=self.sig/(self.sig+self.bkg) 
+            f2=self.bkg/(self.sig+self.bkg)
+            
+            return f1*sigpdf+f2*bkgpdf
+    return sum_function
 
 
 def main(argv):
+    #batch mode: python Generation.py --grid configurations.txt (or --signal/--background/--seeds ranges), see batch_main
+    if(len(argv)>1 and argv[1].startswith("--")):
+        return batch_main(argv)
     print("Generating events")
     
     
     sevents=200
     bevents=1000
     seed=1
+    fileformat="bin"#"txt" for the old text files, one event per line
     print(argv)
     if(len(argv)>1):sevents=argv[1]
     if(len(argv)>2):bevents= argv[2]
     if(len(argv)>3):seed= argv[3]
+    if(len(argv)>4):fileformat= argv[4]
     
+    generate(sevents,bevents,seed,fileformat)
+
+def postfix(sevents,bevents,seed):
+    return "_s"+str(sevents)+"_b"+str(bevents)+"_seed"+str(seed)
+
+def output_name(sevents,bevents,seed,fileformat="bin"):
+    return "generated_events"+postfix(sevents,bevents,seed)+(".txt" if fileformat=="txt" else ".evt")
+
+#Generate one dataset with the expected signal and background events sevents and bevents, and write it to
+#generated_events_s<sevents>_b<bevents>_seed<seed>.evt (or .txt), with its histogram in the .png of the same name.
+#Returns the name of the file.
+def generate(sevents,bevents,seed,fileformat="bin",plot=None):
     seed = int(seed)
 
     s_true=int(sevents)
@@ -48,25 +73,118 @@ def main(argv):
     sigma=50
     l=100
 
-    sb_func=sum_function(a=0,b=3000,seed=seed)
-    sb_func.set_pars(mean = mean, sigma=sigma,l=l,sig=s_true,bkg=b_true)
-    
-    sgen=poisson.rvs(s_true) 
-    bgen=poisson.rvs(b_true) 
+    #all the random numbers come from this generator: the same seed gives the same events
+    rng=np.random.default_rng(seed)
+
+    sgen=rng.poisson(s_true) 
+    bgen=rng.poisson(b_true) 
     #sb=poisson.rvs(s_true+b_true)
-    genevents=sb_func.rvs(size=sgen+bgen)
+
+    metadata={"mean":mean,"sigma":sigma,"l":l,"s_true":s_true,"b_true":b_true,"sgen":int(sgen),"bgen":int(bgen),"seed":seed,"a":0.,"b":3000.}
+
+    #the events are generated and written in chunks, so that large samples don't need to fit in memory
+    #sum_function(a=0,b=3000).rvs(size=sgen+bgen) would generate the same model,
+    #but scipy has to integrate and invert the cdf numerically for every event.
+    chunk=1000000
+    filename=output_name(sevents,bevents,seed,fileformat)
+    if fileformat=="txt":
+        #written under another name and renamed at the end: a text file that exists is complete
+        with open(filename+".tmp","w") as f:
+            for first in range(0,sgen+bgen,chunk):
+                genevents=SignalBackground.sample(rng,min(chunk,sgen+bgen-first),mean,sigma,l,s_true,b_true,a=0.,b=3000.)
+                for g in genevents:
+                    f.write(str(g)+"\n")
+        os.replace(filename+".tmp",filename)
+    else:
+        with EventFiles.eventwriter(filename,metadata) as w:
+            for first in range(0,sgen+bgen,chunk):
+                w.append(SignalBackground.sample(rng,min(chunk,sgen+bgen-first),mean,sigma,l,s_true,b_true,a=0.,b=3000.))
     
-    fig, ax = plt.subplots(1, 1)
-    nbins = 20
-    ax.hist(genevents,nbins)
-    postfix=""
-    if(len(argv)>0):
-        postfix="_s"+str(sevents)+"_b"+str(bevents)+"_seed"+str(seed)
-    plt.savefig("generated_events"+postfix+".png")
-    f = open("generated_events"+postfix+".txt","w")
-    for g in genevents:
-        f.write(str(g)+"\n")
+    #the histogram of the events is optional: STATMETHODS_PLOTS=0 skips it
+    if plot is None:
+        plot=Plotting.enabled()
+    if plot:
+        plt=Plotting.pyplot()
+        fig, ax = plt.subplots(1, 1)
+        nbins = 20
+        ax.hist(EventFiles.load_events(filename),nbins)
+        plt.savefig("generated_events"+postfix(sevents,bevents,seed)+".png")
+        plt.close(fig)
+    return filename
+
+#True if the outputs of a configuration exist and are complete, so that a batch run can skip it.
+#Binary files must have been closed properly, with all the events and the same configuration in the header.
+def done(sevents,bevents,seed,fileformat="bin",plot=False):
+    filename=output_name(sevents,bevents,seed,fileformat)
+    if plot and not os.path.exists("generated_events"+postfix(sevents,bevents,seed)+".png"):
+        return False
+    if fileformat=="txt":
+        return os.path.exists(filename)
+    metadata=EventFiles.complete_metadata(filename)
+    return (metadata is not None and (metadata["s_true"],metadata["b_true"],metadata["seed"])==(int(sevents),int(bevents),int(seed))
+            and metadata["nevents"]==metadata["sgen"]+metadata["bgen"])
+
+def _generate_all(configurations,fileformat,plot):
+    return [generate(s,b,seed,fileformat,plot) for s,b,seed in configurations]
+
+#Configurations from a file with one "sevents bevents seed" per line (commas also separate, # starts a comment)
+def read_grid(path):
+    configurations=[]
+    with open(path) as f:
+        for line in f:
+            fields=line.split("#")[0].replace(","," ").split()
+            if not fields:
+                continue
+            if len(fields)!=3:
+                raise ValueError("expected sevents bevents seed in "+path+": "+line.strip())
+            configurations.append(tuple(int(float(x)) for x in fields))
+    return configurations
+
+#"100,200,300" or "first:stop[:step]" like range, e.g. "1:101" for seeds 1 to 100
+def parse_values(text):
+    values=[]
+    for part in text.split(","):
+        if ":" in part:
+            values.extend(range(*[int(float(x)) for x in part.split(":")]))
+        else:
+            values.append(int(float(part)))
+    return values
+
+#Batch mode: all the configurations of a grid are generated in one run, in a pool of worker processes.
+#Each configuration gets the same files as running Generation.py sevents bevents seed, with the same events,
+#and configurations whose files are already there and complete are skipped, so an interrupted run can be started again.
+def batch_main(argv):
+    import optparse
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    parser=optparse.OptionParser(usage="%prog --grid FILE | --signal S --background B --seeds SEEDS [options]")
+    parser.add_option("--grid",type="string",default=None,help="file with one configuration \"sevents bevents seed\" per line")
+    parser.add_option("--signal",type="string",default="200",help="signal events, e.g. 100,200 or 100:1000:100 [default: %default]")
+    parser.add_option("--background",type="string",default="1000",help="background events [default: %default]")
+    parser.add_option("--seeds",type="string",default="1",help="seeds, e.g. 1:101 [default: %default]")
+    parser.add_option("--workers",type="int",default=1,help="worker processes [default: %default]")
+    parser.add_option("--format",type="choice",choices=["bin","txt"],default="bin",help="bin or txt [default: %default]")
+    parser.add_option("--no-plots",action="store_false",dest="plots",default=Plotting.enabled(),help="don't save the histograms")
+    parser.add_option("--force",action="store_true",default=False,help="generate again the configurations already done")
+    options,args=parser.parse_args(argv[1:])
+
+    if options.grid is not None:
+        configurations=read_grid(options.grid)
+    else:
+        configurations=list(itertools.product(parse_values(options.signal),parse_values(options.background),parse_values(options.seeds)))
+    todo=[c for c in configurations if options.force or not done(*c,fileformat=options.format,plot=options.plots)]
+    print("Generating",len(todo),"configurations,",len(configurations)-len(todo),"already done")
+
+    if options.workers==1:
+        for c in todo:
+            print("written",generate(*c,fileformat=options.format,plot=options.plots))
+        return
+    #a few configurations per task, so that small datasets don't cost one process round trip each
+    chunks=[todo[i::4*options.workers] for i in range(4*options.workers)]
+    with ProcessPoolExecutor(max_workers=options.workers) as pool:
+        futures=[pool.submit(_generate_all,c,options.format,options.plots) for c in chunks if c]
+        for f in as_completed(futures):
+            for filename in f.result():
+                print("written",filename)
 
 if __name__ == "__main__":
     main(sys.argv)
-    
@@ -0,0 +1,154 @@
+#Instrumentation of cost functions: number of calls, time per call, time spent in the model and in the sum over the events,
+#and optionally the last (parameters, value) evaluations, to find slow models and strange paths of the minimizer.
+#It is switched on by the environment variable STATMETHODS_INSTRUMENT, so the scripts don't need to be edited:
+#    STATMETHODS_INSTRUMENT=1 python ExtendedMaximumLikelihoodFit.py       counts and times
+#    STATMETHODS_INSTRUMENT=1000 python ExtendedMaximumLikelihoodFit.py    also the last 1000 evaluations
+#When it is off, instrument(cost) returns cost itself, so there is no overhead at all.
+import collections
+import copy
+import csv
+import json
+import os
+import time
+from iminuit.util import describe, gradient
+
+ENVIRONMENT_VARIABLE="STATMETHODS_INSTRUMENT"
+
+#0 if the instrumentation is off, otherwise the size of the trace buffer (1 means no trace, only counts and times)
+def setting():
+    value=os.environ.get(ENVIRONMENT_VARIABLE,"")
+    try:
+        return max(int(value),0)
+    except ValueError:
+        return 1 if value.lower() in ("yes","true","on") else 0
+
+#The instrumented cost if the instrumentation is on (or enabled=True), otherwise cost itself.
+#trace is the number of evaluations kept, by default the value of STATMETHODS_INSTRUMENT.
+def instrument(cost,trace=None,enabled=None):
+    if enabled is None:
+        enabled=setting()>0
+    if not enabled:
+        return cost
+    if trace is None:
+        trace=setting()
+    return instrumented(cost,trace=trace if trace>1 else 0)
+
+#Write the report of cost to path, if cost is instrumented: json, or csv of the traces if path ends with .csv
+def report(cost,path):
+    if isinstance(cost,instrumented):
+        if path.endswith(".csv"):
+            cost.to_csv(path)
+        else:
+            cost.to_json(path)
+        print("instrumentation of the cost written to",path)
+
+#A function (the model, its logpdf, ...) that adds its time to owner.model_time.
+#Other attributes are taken from the function, so e.g. model.grad is still found by the cost.
+class _timed:
+    def __init__(self,function,owner):
+        self.function=function
+        self.owner=owner
+    def __call__(self,*args,**kwargs):
+        t0=time.perf_counter()
+        try:
+            return self.function(*args,**kwargs)
+        finally:
+            self.owner.model_time+=time.perf_counter()-t0
+    def __getattr__(self,name):
+        if name.startswith("__"):#e.g. looked up by pickle before function is set
+            raise AttributeError(name)
+        return getattr(self.function,name)
+
+#Wraps a cost function: it is called like the cost, with the same parameter names, errordef and gradient.
+#The model time is measured by timing the attributes of the cost that evaluate the model (model, logpdf, components)
+#on a shallow copy of it: the rest of the time of a call is the reduction, i.e. the log and the sum over the events.
+class instrumented:
+    MODEL_ATTRIBUTES=("model","logpdf","components","extended")
+    def __init__(self,cost,trace=0):
+        self.cost=cost
+        parameters=describe(cost,annotations=True)
+        if parameters:
+            self._parameters=parameters
+        if hasattr(cost,"errordef"):
+            self.errordef=cost.errordef
+        self.inner=copy.copy(cost)
+        self.timed=[]
+        for name in self.MODEL_ATTRIBUTES:
+            f=getattr(cost,name,None)
+            if callable(f):
+                try:
+                    setattr(self.inner,name,_timed(f,self))
+                    self.timed.append(name)
+                except AttributeError:#read-only attribute, e.g. a property
+                    pass
+        self.traces=collections.deque(maxlen=trace) if trace else None
+        self.reset()
+
+    def reset(self):
+        self.ncalls=0
+        self.time=0.
+        self.max_time=0.
+        self.model_time=0.
+        self.ngrad=0
+        self.grad_time=0.
+        self.minimum=None
+        if self.traces is not None:
+            self.traces.clear()
+
+    def __call__(self,*par):
+        t0=time.perf_counter()
+        value=self.inner(*par)
+        t=time.perf_counter()-t0
+        self.ncalls+=1
+        self.time+=t
+        self.max_time=max(self.max_time,t)
+        if self.minimum is None or value<self.minimum:
+            self.minimum=float(value)
+        if self.traces is not None:
+            self.traces.append((self.ncalls,tuple(float(p) for p in par),float(value),t))
+        return value
+
+    @property
+    def has_grad(self):
+        return gradient(self.cost) is not None
+    def grad(self,*par):
+        t0=time.perf_counter()
+        model_time=self.model_time
+        try:
+            return self.inner.grad(*par)
+        finally:
+            self.ngrad+=1
+            self.grad_time+=time.perf_counter()-t0
+            self.model_time=model_time#the model calls of the gradient are counted in grad_time
+
+    def summary(self):
+        return {"cost":type(self.cost).__name__,"parameters":list(describe(self)),"calls":self.ncalls,"time":self.time,
+                "time_per_call":self.time/self.ncalls if self.ncalls else None,"max_time_per_call":self.max_time,
+                "model_time":self.model_time,"reduction_time":self.time-self.model_time if self.timed else None,
+                "timed_attributes":self.timed,"grad_calls":self.ngrad,"grad_time":self.grad_time,"minimum":self.minimum}
+
+    #the traces as dictionaries: call number, parameters by name, value and time of the call
+    def trace_records(self):
+        names=list(describe(self))
+        records=[]
+        for call,par,value,t in self.traces or ():
+            record={"call":call}
+            record.update({names[i] if i<len(names) else "x"+str(i):p for i,p in enumerate(par)})
+            record.update(value=value,time=t)
+            records.append(record)
+        return records
+
+    def to_json(self,path=None):
+        text=json.dumps({"summary":self.summary(),"traces":self.trace_records()},indent=1)
+        if path is not None:
+            with open(path,"w") as f:
+                f.write(text)
+        return text
+
+    def to_csv(self,path):
+        records=self.trace_records()
+        fields=list(records[0]) if records else ["call","value","time"]
+        with open(path,"w",newline="") as f:
+            writer=csv.DictWriter(f,fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(records)
@@ -0,0 +1,242 @@
+#Upper limits on the signal yield of the signal+background model with the CLs method, without ROOT.
+#Same method as the AsymptoticCalculator + HypoTestInverter of RooStats (see notebooks/limitFunction.py),
+#with the asymptotic formulas of Cowan, Cranmer, Gross, Vitells (arXiv:1007.1727) for the one-sided profile likelihood,
+#and a root finder on the signal yield instead of a fixed scan.
+import sys,os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import brentq
+from scipy.special import ndtr
+from iminuit import Minuit
+import SignalBackground
+import EventFiles
+import Toys
+
+#Fits of one cost, with the same limits for all of them: unconditional, and conditional on the signal yield
+class sbfitter:
+    def __init__(self,cost,start,a,b,fixed=()):
+        self.cost=cost
+        m=Minuit(cost,*start)
+        m.limits=[(a,b),(1e-3*(b-a),b-a),(1e-3*(b-a),None),(0,None),(0,None)]
+        m.errors=[0.3*abs(v)+1e-3*(b-a) for v in start]
+        m.strategy=0
+        for name in fixed:
+            m.fixed[name]=True
+        self.m=m
+    def unconditional(self):
+        self.m.fixed["sig"]=False
+        self.m.migrad()
+        self.m.migrad()
+        return self.m.fval,np.array(self.m.values)
+    #the fits at different sig start from the last minimum, which is usually close
+    def conditional(self,sig):
+        self.m.fixed["sig"]=True
+        self.m.values["sig"]=sig
+        self.m.migrad()
+        return self.m.fval,np.array(self.m.values)
+
+#p-values of the one-sided test statistic q~mu (upper limits with sig>=0), given qA = mu^2/sigma^2 from the Asimov dataset:
+#returns CLs = p_mu/(1-p_b)
+def cls_from_q(q,qA):
+    q=max(q,0.)
+    sqA=np.sqrt(qA)
+    if q<=qA:
+        pmu=1-ndtr(np.sqrt(q))
+        clb=ndtr(sqA-np.sqrt(q))
+    else:
+        pmu=1-ndtr((q+qA)/(2*sqA))
+        clb=1-ndtr((q-qA)/(2*sqA))
+    return pmu/clb
+
+#Value of q~mu if the fitted signal is nsigma standard deviations (sigma = mu/sqrt(qA)) away from 0:
+#used for the median expected limit (nsigma=0) and its bands (nsigma=+-1,+-2) under the background only hypothesis
+def expected_q(qA,nsigma):
+    sqA=np.sqrt(qA)
+    if nsigma>=sqA:
+        return 0.
+    if nsigma>=0:
+        return (sqA-nsigma)**2
+    return qA-2*nsigma*sqA
+
+class asymptoticcls:
+    #events: the observed events. start: starting values of mean, sigma, l, sig, bkg.
+    #fixed: names of the parameters kept at their starting value, e.g. ("mean","sigma") when searching for a signal of known shape.
+    #All the other parameters except sig are nuisance parameters, profiled in every fit.
+    #The Asimov dataset is the background only expectation (nuisances from the fit to the data with sig=0)
+    #integrated in nbins bins, so that its likelihood is computed exactly without generating anything.
+    def __init__(self,events,start=None,a=0.,b=3000.,fixed=(),nbins=1000):
+        events=np.asarray(events,dtype=np.float64)
+        if start is None:
+            start=(200.,100.,200.,10.,max(len(events)-10.,1.))
+        self.data=sbfitter(SignalBackground.sbextendednll(events,a=a,b=b),start,a,b,fixed)
+        self.fmin,self.best=self.data.unconditional()
+
+        f0,values0=self.data.conditional(0.)
+        edges=np.linspace(a,b,nbins+1)
+        asimov_counts=SignalBackground.sb_bin_counts(edges,*values0,a,b)
+        self.asimov=sbfitter(SignalBackground.sbbinnednll(None,bins=edges,a=a,b=b,counts=asimov_counts),values0,a,b,fixed)
+        #the Asimov dataset is exactly the model with values0, and the cost is relative to the saturated model: its minimum is 0
+        self.asimov.m.values=values0
+        self.fmin_asimov=self.asimov.m.fcn(values0)
+        self.qs={}
+
+    #observed q~mu and Asimov qA for sig=mu
+    def q(self,mu):
+        if mu not in self.qs:
+            if mu<=self.best[3]:
+                q=0.
+            else:
+                q=self.data.conditional(mu)[0]-self.fmin
+            qA=self.asimov.conditional(mu)[0]-self.fmin_asimov
+            self.qs[mu]=(q,qA)
+        return self.qs[mu]
+
+    def cls(self,mu):
+        q,qA=self.q(mu)
+        return cls_from_q(q,qA)
+
+    def expected_cls(self,mu,nsigma=0):
+        qA=self.q(mu)[1]
+        return cls_from_q(expected_q(qA,nsigma),qA)
+
+    #Upper limit on sig at confidence level cl: the value where CLs = 1-cl, found with brentq.
+    #Returns the observed limit and the expected ones for nsigma = -2,-1,0,1,2
+    def upper_limit(self,cl=0.95,nsigmas=(-2,-1,0,1,2),rtol=1e-4):
+        alpha=1-cl
+        #bracket: CLs is 1 at sig=0 and decreases with sig, we go up until it is below alpha
+        scale=max(np.sqrt(self.best[4]),1.)
+        limits={}
+        functions=[("observed",self.cls)]+[(n,lambda mu,n=n:self.expected_cls(mu,n)) for n in nsigmas]
+        for name,f in functions:
+            lo=1e-6*scale
+            hi=self.best[3]+scale
+            while f(hi)>alpha:
+                lo,hi=hi,2*hi
+            limits[name]=brentq(lambda mu:f(mu)-alpha,lo,hi,rtol=rtol)
+        return {"observed":limits["observed"],"expected":{n:limits[n] for n in nsigmas}}
+
+#q~mu of ntoys pseudo-experiments generated with the parameters values (mean, sigma, l, sig, bkg):
+#all toys are sampled in one vectorized call
+def toy_qs(mu,values,ntoys,seed,a,b,fixed):
+    toys=Toys.generate_sb_toys(ntoys,*values,a=a,b=b,seed=seed)
+    qs=np.empty(ntoys)
+    for i,x in enumerate(toys):
+        fitter=sbfitter(SignalBackground.sbextendednll(x,a=a,b=b),values,a,b,fixed)
+        fmin,best=fitter.unconditional()
+        qs[i]=0. if best[3]>mu else max(fitter.conditional(mu)[0]-fmin,0.)
+    return qs
+
+#Frequentist CLs: the distributions of q~mu under S+B (sig=mu) and B only (sig=0) are sampled with toys,
+#generated with the nuisance parameters fitted to the data at sig=mu and at sig=0.
+#The toys of each signal value are generated in batches over a process pool, and we stop as soon as CLs is known well enough
+#to say on which side of 1-cl it is: |CLs-(1-cl)| > decide*error, with the binomial error of the fractions of toys.
+#Batches are used in order and each has its own random stream, so the result does not depend on the number of workers.
+class frequentistcls(asymptoticcls):
+    def __init__(self,events,start=None,a=0.,b=3000.,fixed=(),workers=1,seed=1):
+        asymptoticcls.__init__(self,events,start=start,a=a,b=b,fixed=fixed)
+        self.a=a
+        self.b=b
+        self.fixed=fixed
+        self.workers=workers
+        self.seed=seed
+
+    #Returns CLs, its error, the number of toys per hypothesis, and the expected CLs for nsigmas from the same toys.
+    #(cls(mu), inherited, is still the asymptotic CLs.) At most maxtoys//batch batches of toys are run.
+    def toy_cls(self,mu,cl=0.95,maxtoys=2500,batch=100,decide=3.,nsigmas=(-2,-1,0,1,2),pool=None):
+        if batch<1 or maxtoys<batch:
+            raise ValueError("need maxtoys >= batch >= 1, got maxtoys=%d and batch=%d"%(maxtoys,batch))
+        alpha=1-cl
+        qobs=self.q(mu)[0]
+        values_sb=self.data.conditional(mu)[1]
+        values_b=self.data.conditional(0.)[1]
+        seeds=np.random.SeedSequence([self.seed,int(round(mu*1e6))]).spawn(2*(maxtoys//batch))
+        jobs=[(mu,values,batch,seeds[2*i+j],self.a,self.b,self.fixed) for i in range(maxtoys//batch) for j,values in enumerate((values_sb,values_b))]
+        qs_sb=[]
+        qs_b=[]
+        for i,qs in enumerate(self._run(jobs,pool)):
+            (qs_sb if i%2==0 else qs_b).append(qs)
+            if i%2==0:
+                continue
+            n=len(qs_sb)*batch
+            p_sb=np.count_nonzero(np.concatenate(qs_sb)>=qobs)/n
+            clb=np.count_nonzero(np.concatenate(qs_b)>=qobs)/n
+            cls=p_sb/max(clb,1./n)
+            #binomial errors, with the fractions kept away from 0 and 1 so that e.g. no toy above qobs is not taken as exact
+            p,c=np.clip([p_sb,clb],1./n,1-1./n)
+            error=np.sqrt(p*(1-p)/n)/c*np.sqrt(1+cls**2*c*(1-c)/(p*(1-p)))
+            if abs(cls-alpha)>decide*error:
+                break
+
+        qs_sb=np.concatenate(qs_sb)
+        qs_b=np.concatenate(qs_b)
+        expected={}
+        for nsigma in nsigmas:
+            qexp=np.quantile(qs_b,ndtr(-nsigma))
+            expected[nsigma]=np.mean(qs_sb>=qexp)/max(np.mean(qs_b>=qexp),1./len(qs_b))
+        return cls,error,len(qs_sb),expected
+
+    #results of the jobs in order: with a pool, only as many jobs as workers are running ahead of the one we wait for,
+    #the others are cancelled when the caller stops asking
+    def _run(self,jobs,pool):
+        if pool is None:
+            for job in jobs:
+                yield toy_qs(*job)
+            return
+        futures=[pool.submit(toy_qs,*job) for job in jobs[:self.workers]]
+        try:
+            for i in range(len(jobs)):
+                if i+self.workers<len(jobs):
+                    futures.append(pool.submit(toy_qs,*jobs[i+self.workers]))
+                yield futures[i].result()
+        finally:
+            for f in futures:
+                f.cancel()
+
+    #CLs at npoints signal values between poimin and poimax (as SetFixedScan in RooStats),
+    #and the upper limits where the observed and expected CLs cross 1-cl, interpolated linearly in log(CLs)
+    def upper_limit(self,cl=0.95,npoints=8,poimin=0.,poimax=500.,nsigmas=(-2,-1,0,1,2),**options):
+        points=np.linspace(poimin,poimax,npoints+1)[1:] if poimin<=0 else np.linspace(poimin,poimax,npoints)
+        if self.workers==1:
+            scan=[self.toy_cls(mu,cl,nsigmas=nsigmas,**options) for mu in points]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                scan=[self.toy_cls(mu,cl,nsigmas=nsigmas,pool=pool,**options) for mu in points]
+        observed=np.array([r[0] for r in scan])
+        limits={"observed":crossing(points,observed,1-cl),"expected":{}}
+        for nsigma in nsigmas:
+            limits["expected"][nsigma]=crossing(points,np.array([r[3][nsigma] for r in scan]),1-cl)
+        limits["scan"]=(points,observed,np.array([r[1] for r in scan]),np.array([r[2] for r in scan]))
+        return limits
+
+#First value of x where y goes below level, interpolated linearly in log(y)
+def crossing(x,y,level):
+    logy=np.log(np.maximum(y,1e-12))
+    for i in range(1,len(x)):
+        if y[i]<level<=y[i-1]:
+            return x[i-1]+(x[i]-x[i-1])*(logy[i-1]-np.log(level))/(logy[i-1]-logy[i])
+    return np.nan
+
+def main(argv):
+    postfix=""
+    if(len(argv)>1):postfix = argv[1]
+    filename="generated_events"+str(postfix)+".evt"
+    if not os.path.exists(filename):
+        filename="generated_events"+str(postfix)+".txt"
+    events=EventFiles.load_events(filename)
+
+    #we look for a signal of known shape: a gaussian at 250 with width 50, as generated by Generation
+    calc=asymptoticcls(events,start=(250.,50.,200.,10.,max(len(events)-10.,1.)),fixed=("mean","sigma"))
+    print("best fit: mean, sigma, l, sig, bkg =",calc.best)
+    for cl in [0.90,0.95]:
+        limits=calc.upper_limit(cl)
+        print("====\n",cl,"CL upper limit is ",limits["observed"]," exp ",limits["expected"][0]," p1 ",limits["expected"][1]," m1 ",limits["expected"][-1]," p2 ",limits["expected"][2]," m2 ",limits["expected"][-2],"\n\n ====")
+
+    #the frequentist limit with toys takes longer: run it with "freq" as second argument, and the number of workers as third
+    if(len(argv)>2 and argv[2]=="freq"):
+        workers=int(argv[3]) if len(argv)>3 else 1
+        freqcalc=frequentistcls(events,start=(250.,50.,200.,10.,max(len(events)-10.,1.)),fixed=("mean","sigma"),workers=workers)
+        limits=freqcalc.upper_limit(0.90,npoints=8,poimin=0,poimax=2*calc.upper_limit(0.90)["expected"][2])
+        print("====\n frequentist 0.9 CL upper limit is ",limits["observed"]," exp ",limits["expected"][0]," p1 ",limits["expected"][1]," m1 ",limits["expected"][-1],"\n\n ====")
+
+if __name__ == "__main__":
+    main(sys.argv)
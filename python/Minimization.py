@@ -1,40 +1,98 @@
 #Part 1: fitting with minuit
 
-from iminuit import Minuit
-from scipy.stats import norm
-from scipy.optimize import fmin, fmin_bfgs,minimize, curve_fit, SR1,BFGS
-from scipy.stats import rv_continuous
-from iminuit.util import describe, make_func_code
+#iminuit, scipy and matplotlib are imported in the functions that use them:
+#the cost functions below need only numpy, and scripts that just generate events or evaluate a cost start much faster.
 import numpy as np
 import math
+import itertools
+import functools
 import sys
-import matplotlib.pyplot as plt
+import EventFiles
 
 #Let's first define the metrics, chi2 
 def chi2(model,x,y,sigma,*par):
     return ((model(x,*par)-y)/sigma)**2
 
+#Some standard models, which also know their derivatives with respect to the parameters (model.grad, one row per parameter).
+#The cost functions below use them to compute analytic gradients, so the minimizers don't need finite differences.
+def linear_model(x,a,b):
+    return a+b*x
+
+def gaussian_model(x,mu,sigma):
+    return 1/(sigma*np.sqrt(2*math.pi)) * np.exp(-(x-mu)*(x-mu) / (2* sigma*sigma) )
+
+def _linear_grad(x,a,b):
+    return np.array([np.ones_like(x),x])
+
+def _gaussian_grad(x,mu,sigma):
+    f=gaussian_model(x,mu,sigma)
+    z=(x-mu)/sigma
+    return np.array([f*z/sigma,f*(z*z-1)/sigma])
+
+#exponential pdf with mean l, for x>=0
+def exponential_model(x,l):
+    return np.where(np.asarray(x)>=0,np.exp(-np.asarray(x)/l)/l,0.)
+
+def _exponential_grad(x,l):
+    f=exponential_model(x,l)
+    return np.array([f*(x/l-1)/l])
+
+linear_model.grad=_linear_grad
+gaussian_model.grad=_gaussian_grad
+exponential_model.grad=_exponential_grad
+
 class leastsquares:
-    def __init__(self,model,xs,ys,sigmas):# here I initialize the class with a constructor 
+    def __init__(self,model,xs,ys,sigmas,vectorized=True):# here I initialize the class with a constructor 
         self.model=model
-        self.xs=xs
-        self.ys=ys
-        self.sigmas=sigmas
+        #store the points once as contiguous arrays, so that the model can be evaluated on all of them in one call
+        self.xs=np.ascontiguousarray(xs,dtype=np.float64)
+        self.ys=np.ascontiguousarray(ys,dtype=np.float64)
+        self.sigmas=np.ascontiguousarray(sigmas,dtype=np.float64)
+        self.vectorized=vectorized
     def __call__(self, *par):# once I initialized I can call the class as a function of the arguments *par
+        if self.vectorized:
+            chitot=self._vectorized_call(*par)
+            if chitot is not None:
+                return chitot
+            self.vectorized=False#the model does not broadcast over arrays: from now on use the point-by-point sum
         chitot=0
         for i in range(len(self.xs)):
             chitot=chitot+chi2(self.model,self.xs[i],self.ys[i],self.sigmas[i],*par)
         return chitot
+    def _vectorized_call(self, *par):
+        try:
+            ym=np.asarray(self.model(self.xs,*par),dtype=np.float64)
+        except (TypeError,ValueError):#e.g. a model using math.exp can only take one x at a time
+            return None
+        if ym.shape!=self.xs.shape:
+            return None
+        return np.sum(((ym-self.ys)/self.sigmas)**2)
+    #analytic gradient, available if the model has a grad (see linear_model): it is used automatically by Minuit and by fit
+    @property
+    def has_grad(self):
+        return self.vectorized and hasattr(self.model,"grad")
+    def grad(self, *par):
+        residuals=(self.model(self.xs,*par)-self.ys)/self.sigmas**2
+        return 2*np.asarray(self.model.grad(self.xs,*par)) @ residuals
 
-class gaussian_gen(rv_continuous):#this is how inheritance is set up in python:
-#here gaussian_gen inherits all methods from the class rv_continuous of scipy stats
-    
-    def set_pars(self,mean,sigma):#define a custom method to set some parameters
-        self.mean=mean
-        self.sigma=sigma
-    
-    def _pdf(self, x):#here I implement the concrete version of the abstract method _pdf, which evaluates the probability density 
-        return np.exp(-(x-self.mean)**2 / (2.*self.sigma**2)) / (self.sigma*np.sqrt(2.0 * np.pi))
+#gaussian_gen(a=...,b=...,name=...) makes a distribution of the class below: it is created the first time it is needed,
+#so that scipy.stats is imported only by the code that uses it
+def gaussian_gen(*args,**kwargs):
+    return _gaussian_gen_class()(*args,**kwargs)
+
+@functools.lru_cache(maxsize=None)
+def _gaussian_gen_class():
+    from scipy.stats import rv_continuous
+    class gaussian_gen(rv_continuous):#this is how inheritance is set up in python:
+    #here gaussian_gen inherits all methods from the class rv_continuous of scipy stats
+        
+        def set_pars(self,mean,sigma):#define a custom method to set some parameters
+            self.mean=mean
+            self.sigma=sigma
+        
+        def _pdf(self, x):#here I implement the concrete version of the abstract method _pdf, which evaluates the probability density 
+            return np.exp(-(x-self.mean)**2 / (2.*self.sigma**2)) / (self.sigma*np.sqrt(2.0 * np.pi))
+    return gaussian_gen
 
 
 #And Negative Log Likelihood to minimize 
@@ -44,6 +102,186 @@ class nll:
         self.model=model
     def __call__(self, *par):
         return np.sum([-2*math.log(self.model(xi,*par)) for xi in self.x])
+    #-2 sum of grad(f)/f, if the model has a grad (see gaussian_model)
+    @property
+    def has_grad(self):
+        return hasattr(self.model,"grad")
+    def grad(self, *par):
+        x=np.asarray(self.x,dtype=np.float64)
+        return -2*np.sum(np.asarray(self.model.grad(x,*par))/self.model(x,*par),axis=1)
+
+#Parallel evaluation of the costs on large samples: the events are split in chunks of fixed size, each chunk is evaluated
+#in a thread (numpy releases the GIL in its array operations, so the threads run on different cores) and the partial sums
+#are added in the order of the chunks with math.fsum. The chunks depend only on chunksize, so the result is the same
+#with any number of threads. Chunks of ~2 MB also keep the temporary arrays of the model in the cache of the cores.
+DEFAULT_CHUNKSIZE=2**18
+
+#The thread pools are kept for the whole program, one per number of threads, so each call only dispatches the chunks.
+#They are not attributes of the costs, which can still be pickled and sent to other processes.
+_thread_pools={}
+def thread_pool(threads):
+    if threads not in _thread_pools:
+        from concurrent.futures import ThreadPoolExecutor
+        _thread_pools[threads]=ThreadPoolExecutor(max_workers=threads)
+    return _thread_pools[threads]
+
+#Views of x in consecutive chunks of chunksize events (one chunk if chunksize is None)
+def split(x,chunksize):
+    if chunksize is None or len(x)<=chunksize:
+        return [x]
+    return [x[i:i+chunksize] for i in range(0,len(x),chunksize)]
+
+#Sum of f(item) over the items, which are evaluated in threads threads. f can return a number or an array:
+#the partial results are added element by element, always in the order of the items.
+def parallel_sum(f,items,threads=1):
+    if threads>1 and len(items)>1:
+        partials=list(thread_pool(threads).map(f,items))
+    else:
+        partials=[f(item) for item in items]
+    if len(partials)==1:
+        return partials[0]
+    partials=np.asarray(partials,dtype=np.float64)
+    if partials.ndim==1:
+        return math.fsum(partials)
+    return np.array([math.fsum(column) for column in partials.reshape(len(partials),-1).T]).reshape(partials.shape[1:])
+
+#Faster version of nll: the model is called once on the whole array of events instead of once per event.
+#The events are split in chunks of chunksize, evaluated in a pool of threads threads (see parallel_sum):
+#the result does not depend on the number of threads, only on chunksize.
+class batchnll:
+    def __init__(self,model,x,logpdf=None,compensated=False,threads=1,chunksize=DEFAULT_CHUNKSIZE):
+        self.x=np.ascontiguousarray(x,dtype=np.float64)
+        self.model=model
+        #if the log of the pdf is available we use it directly, it is faster and more precise than log(pdf)
+        if logpdf is None:
+            logpdf=getattr(model,"logpdf",None)
+        self.logpdf=logpdf
+        self.compensated=compensated
+        self.threads=threads
+        self.chunksize=chunksize
+    def __call__(self, *par):
+        return -2*parallel_sum(lambda x:stable_sum(self.logvalues(x,*par),self.compensated),split(self.x,self.chunksize),self.threads)
+    def logvalues(self,x,*par):
+        if self.logpdf is not None:
+            return self.logpdf(x,*par)
+        try:
+            values=np.asarray(self.model(x,*par),dtype=np.float64)
+        except (TypeError,ValueError):
+            values=None
+        if values is None or values.shape!=x.shape:#the model does not broadcast: evaluate it event by event
+            values=np.array([self.model(xi,*par) for xi in x],dtype=np.float64)
+        return np.log(values)
+    @property
+    def has_grad(self):
+        return hasattr(self.model,"grad")
+    def grad(self, *par):
+        return -2*parallel_sum(lambda x:np.sum(np.asarray(self.model.grad(x,*par))/self.model(x,*par),axis=1),split(self.x,self.chunksize),self.threads)
+
+#Sum of many terms: np.sum uses pairwise summation, math.fsum is exactly rounded (compensated) but slower
+def stable_sum(values,compensated=False):
+    if compensated:
+        return math.fsum(values)
+    return np.sum(values)
+
+#Exponential-family models: -2 log L depends on the data only through a few sums, the sufficient statistics.
+#They are computed once, and every evaluation of the cost, of its gradient and of its hessian is O(1).
+#A model declares its family with model.sufficient (see gaussian_model and exponential_model below);
+#the family knows its support, and data outside of it can't use the statistics.
+class gaussianfamily:
+    support=(-np.inf,np.inf)
+    #number of events, mean and sum of squared deviations from the mean: sum (x-mu)^2 = m2 + n (mean-mu)^2
+    #without the cancellations of sum x^2 - 2 mu sum x + n mu^2
+    @staticmethod
+    def statistics(x):
+        mean=np.mean(x) if len(x)>0 else 0.
+        return len(x),mean,np.sum((x-mean)**2)
+    #statistics of two samples together, from those of each one (Chan et al. update of the mean and of m2)
+    @staticmethod
+    def merge(stats,other):
+        n1,mean1,m21=stats
+        n2,mean2,m22=other
+        n=n1+n2
+        if n==0:
+            return stats
+        delta=mean2-mean1
+        return n,mean1+delta*n2/n,m21+m22+delta*delta*n1*n2/n
+    @staticmethod
+    def nll(stats,mu,sigma):
+        n,mean,m2=stats
+        return (m2+n*(mean-mu)**2)/sigma**2+2*n*math.log(sigma)+n*math.log(2*math.pi)
+    @staticmethod
+    def grad(stats,mu,sigma):
+        n,mean,m2=stats
+        s=m2+n*(mean-mu)**2
+        return np.array([-2*n*(mean-mu)/sigma**2,-2*s/sigma**3+2*n/sigma])
+    @staticmethod
+    def hessian(stats,mu,sigma):
+        n,mean,m2=stats
+        s=m2+n*(mean-mu)**2
+        dmudsigma=4*n*(mean-mu)/sigma**3
+        return np.array([[2*n/sigma**2,dmudsigma],[dmudsigma,6*s/sigma**4-2*n/sigma**2]])
+
+class exponentialfamily:
+    support=(0.,np.inf)
+    @staticmethod
+    def statistics(x):
+        return len(x),np.sum(x)
+    @staticmethod
+    def merge(stats,other):
+        return stats[0]+other[0],stats[1]+other[1]
+    @staticmethod
+    def nll(stats,l):
+        n,sumx=stats
+        return 2*sumx/l+2*n*math.log(l)
+    @staticmethod
+    def grad(stats,l):
+        n,sumx=stats
+        return np.array([-2*sumx/l**2+2*n/l])
+    @staticmethod
+    def hessian(stats,l):
+        n,sumx=stats
+        return np.array([[4*sumx/l**3-2*n/l**2]])
+
+gaussian_model.sufficient=gaussianfamily
+exponential_model.sufficient=exponentialfamily
+
+#-2 log L of an exponential-family model from the sufficient statistics of x: the time of a fit does not depend on the number of events.
+#Minuit uses grad for migrad and hessian for hesse.
+class sufficientnll:
+    def __init__(self,model,x,family=None):
+        self.model=model
+        self.family=family if family is not None else model.sufficient
+        self.stats=self.family.statistics(np.ascontiguousarray(x,dtype=np.float64))
+        self._parameters={name:None for name in _model_parameters(model)}
+    #add new events in O(len(x)): their statistics are merged with those of the events before
+    def update(self,x):
+        x=np.ascontiguousarray(x,dtype=np.float64)
+        if len(x)>0 and (np.min(x)<self.family.support[0] or np.max(x)>self.family.support[1]):
+            raise ValueError("events outside the support of the model")
+        self.stats=self.family.merge(self.stats,self.family.statistics(x))
+    def __call__(self, *par):
+        return self.family.nll(self.stats,*par)
+    def grad(self, *par):
+        return self.family.grad(self.stats,*par)
+    def hessian(self, *par):
+        return self.family.hessian(self.stats,*par)
+
+def _model_parameters(model):
+    from iminuit.util import describe
+    return describe(model)[1:]
+
+#The fastest cost for the unbinned -2 log L of model on the events x:
+#sufficientnll if the model belongs to an exponential family (model.sufficient, or family) and all the events are in its support,
+#otherwise batchnll. support is the range where model is normalized: if it is narrower than the support of the family
+#(a truncated model), the family does not apply and the array path is used.
+def compressednll(model,x,support=None,family=None,**options):
+    if family is None:
+        family=getattr(model,"sufficient",None)
+    x=np.ascontiguousarray(x,dtype=np.float64)
+    if family is not None and (support is None or (support[0]<=family.support[0] and support[1]>=family.support[1])):
+        if len(x)>0 and family.support[0]<=np.min(x) and np.max(x)<=family.support[1]:
+            return sufficientnll(model,x,family)
+    return batchnll(model,x,**options)
 
 #If the likelihood of the sample needs to be calculated altogether 
 class extendednll:
@@ -53,15 +291,132 @@ class extendednll:
     def __call__(self, *par):
         return self.model(self.x,*par)  
 
+#Same as batchnll, but the events are never all in memory: they are read chunk by chunk at every call.
+#source can be a binary event file (read with a memory map, see EventFiles), an array,
+#or a function returning an iterator over the chunks (a generator is used up after one pass, so we need a new one every call).
+#Each chunk is summed with np.sum (pairwise) and the partial sums are added with math.fsum, so the last digits of the result
+#depend on how the events are split in chunks (chunksize, or the chunks yielded by the source function).
+#If extended is given, the likelihood is extended: model is the density normalized to the expected events extended(*par),
+#and the cost is 2*extended(*par) - 2*sum log(model).
+class streamingnll(batchnll):
+    def __init__(self,model,source,chunksize=1000000,logpdf=None,extended=None):
+        batchnll.__init__(self,model,[],logpdf=logpdf)
+        self.source=source
+        self.chunksize=chunksize
+        self.extended=extended
+    has_grad=False
+    def __call__(self, *par):
+        partials=[np.sum(self.logvalues(chunk,*par)) for chunk in self.chunks()]
+        nll=-2*math.fsum(partials)
+        if self.extended is not None:
+            nll+=2*self.extended(*par)
+        return nll
+    def chunks(self):
+        if callable(self.source):
+            for chunk in self.source():
+                yield np.ascontiguousarray(chunk,dtype=np.float64)
+        elif isinstance(self.source,str):
+            for first in itertools.count(0,self.chunksize):
+                chunk=EventFiles.read_events(self.source,first,first+self.chunksize)
+                if len(chunk)==0:
+                    break
+                yield chunk
+        else:
+            for first in range(0,len(self.source),self.chunksize):
+                yield np.ascontiguousarray(self.source[first:first+self.chunksize],dtype=np.float64)
+
+#Minimizer backends: the same cost can be minimized with minuit or with scipy.optimize, chosen with backend.
+#If the cost has an analytic gradient it is passed to the minimizer (Minuit finds it by itself, scipy gets it as jac).
+#The result is a dictionary with values, errors, fval, nfcn (number of calls of the cost), valid and the backend name.
+def fit(cost,start,backend="minuit",**options):
+    return backends[backend](cost,start,**options)
+
+def _fit_minuit(cost,start,strategy=None):
+    from iminuit import Minuit
+    from iminuit.util import gradient
+    m=Minuit(cost,*start)
+    if strategy is None:#with an analytic gradient strategy 0 is enough, and it skips the numerical checks of the gradient
+        strategy=0 if gradient(cost) is not None else 1
+    m.strategy=strategy
+    m.migrad()
+    m.hesse()
+    return {"values":np.array(m.values),"errors":np.array(m.errors),"fval":m.fval,"nfcn":m.nfcn,"valid":m.valid,"backend":"minuit"}
+
+def _fit_scipy(cost,start,method="BFGS"):
+    from scipy.optimize import minimize
+    from iminuit.util import gradient
+    jac=None
+    if method!="Nelder-Mead" and gradient(cost) is not None:#Nelder-Mead uses only the function values
+        jac=lambda p: np.asarray(cost.grad(*p),dtype=np.float64)
+    res=minimize(lambda p: cost(*p),np.asarray(start,dtype=np.float64),jac=jac,method=method)
+    #near the minimum cost = fmin + 1/2 dp^T H dp, and one standard deviation is cost = fmin + errordef.
+    #The hess_inv of BFGS is only the estimate the minimizer built along its path, often far from the curvature
+    #at the minimum, so H is computed again at res.x.
+    covariance=2*getattr(cost,"errordef",1)*_inverse(hessian(cost,res.x))
+    errors=np.sqrt(np.diag(covariance)) if np.all(np.diag(covariance)>0) else np.full(len(start),np.nan)
+    return {"values":res.x,"errors":errors,"fval":res.fun,"nfcn":res.nfev,"valid":res.success,"backend":method}
+
+#Hessian of cost at x: cost.hessian if the cost has one, otherwise central differences of cost.grad or of the cost.
+#The steps are first a small fraction of the parameters, then a tenth of the standard deviations this first pass gives,
+#so that they follow the scale of each parameter.
+def hessian(cost,x):
+    from iminuit.util import gradient
+    x=np.asarray(x,dtype=np.float64)
+    if callable(getattr(cost,"hessian",None)):
+        return np.asarray(cost.hessian(*x),dtype=np.float64)
+    grad=gradient(cost)
+    steps=1e-4*np.maximum(np.abs(x),1e-2)
+    for i in range(2):
+        h=_hessian_differences(cost,grad,x,steps)
+        with np.errstate(invalid="ignore",divide="ignore"):
+            sigma=np.sqrt(2*getattr(cost,"errordef",1)/np.diag(h))
+        if not np.all(np.isfinite(sigma)):
+            break
+        steps=0.1*sigma
+    return h
+
+def _hessian_differences(cost,grad,x,steps):
+    n=len(x)
+    e=np.diag(steps)
+    h=np.empty((n,n))
+    if grad is not None:
+        for i in range(n):
+            h[:,i]=(np.asarray(grad(*(x+e[i])))-np.asarray(grad(*(x-e[i]))))/(2*steps[i])
+        return (h+h.T)/2
+    f0=cost(*x)
+    for i in range(n):
+        h[i,i]=(cost(*(x+e[i]))-2*f0+cost(*(x-e[i])))/steps[i]**2
+        for j in range(i):
+            h[i,j]=h[j,i]=(cost(*(x+e[i]+e[j]))-cost(*(x+e[i]-e[j]))-cost(*(x-e[i]+e[j]))+cost(*(x-e[i]-e[j])))/(4*steps[i]*steps[j])
+    return h
+
+#inverse of a Hessian, NaN if it is not positive definite (not a minimum, or a flat direction)
+def _inverse(h):
+    try:
+        np.linalg.cholesky(h)
+        return np.linalg.inv(h)
+    except np.linalg.LinAlgError:
+        return np.full(h.shape,np.nan)
+
+backends={
+    "minuit":_fit_minuit,
+    "bfgs":lambda cost,start,**options:_fit_scipy(cost,start,method="BFGS",**options),
+    "l-bfgs-b":lambda cost,start,**options:_fit_scipy(cost,start,method="L-BFGS-B",**options),
+    "nelder-mead":lambda cost,start,**options:_fit_scipy(cost,start,method="Nelder-Mead",**options),
+}
+
 #Now for the executable function part! For simplicity, we define a "main function", the actual function is the one below  
 def main(argv):
+    from iminuit import Minuit
+    from scipy.stats import norm
+    from scipy.optimize import fmin, fmin_bfgs
+    import Plotting
     print("Simple Fitting procedure!")
 
     #Let's now make an example: 
 
     #Linear function      
     linear = lambda x,a,b : a+b*x
-    gaussian = lambda x,mu,sigma : 1/(sigma*np.sqrt(2*math.pi)) * np.exp(-(x-mu)*(x-mu) / (2* sigma*sigma) )
 
     #Those are equivalent to:
     def linear_func(x,a,b):
@@ -122,6 +477,12 @@ def main(argv):
     print("Now printing the scipy minimum with scipi.optimize.fmin_bfgs", scipy_min)
     #note this is a different minimization method! 
 
+    #linear_model is the same as linear, but it also knows its derivatives: the cost then has an analytic gradient.
+    #With fit we can choose the minimizer, both use the gradient instead of finite differences
+    ls_grad=leastsquares(linear_model,xsm,ys,xss)
+    print("minuit with analytic gradient", fit(ls_grad,[a,b],backend="minuit"))
+    print("scipy bfgs with analytic gradient", fit(ls_grad,[a,b],backend="bfgs"))
+
     
     #how do I understand if the fit works?
     #1) Have a figure of merit, or a metrics for the fit quality
@@ -135,21 +496,25 @@ def main(argv):
     #in this case means : generate a lot of fits!
     
     #I generate a lot of pseudoexperiments:
-    pulls_a=[]
-    pulls_b=[]
-    for i in range(1000):
-        y_i=[linear(norm(x[0],x[1]).rvs(),a,b) for x in zip(xsm,xss)] 
-        ls_i = leastsquares(linear, xsm,y_i,xss)
-        m_i = Minuit(ls_i,a,b) 
-        m_i.migrad()
-        m_i.migrad()
-        m_i.hesse()
-#        print(" a ", a, "m_i ",m_i.values[0])
-        pull_a_i = (a-m_i.values[0])/m_i.errors[0]
-        pulls_a.append(pull_a_i)
+    import Toys
+    #each one is generated by generate_i, fitted with the cost made by cost_i, and the pull (a-a_fit)/error is stored
+    def generate_i(rng):
+        return linear(rng.normal(xsm,xss),a,b)
+    def cost_i(y_i):
+        return leastsquares(linear, xsm,y_i,xss)
+    toys=Toys.run_toys(cost_i,generate_i,[a,b],1000,seed=1)
+    pulls_a=toys["pulls"][:,0]
 
     print("pulls mean is: " ,np.mean(pulls_a))#numpy mean 
     print("pluss standard deviation is : ",np.std(pulls_a))#numpy) standard deviation 
+
+    #linear is linear in a and b: y = X @ (a,b) with the design matrix X = (1, x).
+    #In this case the minimum and its errors can be computed exactly for all the toys at once, without minuit:
+    design=np.column_stack([np.ones(len(xsm)),xsm])
+    ys_toys=linear(np.random.default_rng(1).normal(xsm,xss,size=(1000,len(xsm))),a,b)
+    fast_toys=Toys.linear_toys(design,ys_toys,xss,truth=[a,b])
+    print("pulls mean with the closed form solution is: " ,np.mean(fast_toys["pulls"][:,0]))
+    print("pulls standard deviation with the closed form solution is : ",np.std(fast_toys["pulls"][:,0]))
     
     #Example 1.2: Gaussian fit: 
     
@@ -163,14 +528,16 @@ def main(argv):
     #Norm is more efficient:
     values=norm(104,10).rvs(1000)
 
-    fig, ax = plt.subplots(1, 1)
-    nbins = 20
-    ax.hist(values,nbins)
-    plt.savefig("gaussian_example.png")
+    if Plotting.enabled():
+        plt=Plotting.pyplot()
+        fig, ax = plt.subplots(1, 1)
+        nbins = 20
+        ax.hist(values,nbins)
+        plt.savefig("gaussian_example.png")
 
 
     #Define the NLL function
-    nl=nll(gaussian,values)
+    nl=batchnll(gaussian_model,values)#same as nll(gaussian,values), but the model is evaluated on all values at once and has an analytic gradient
     mu = 50
     sigma = 5
     print(nl(mu,sigma))
@@ -191,6 +558,13 @@ def main(argv):
     print ( m2.params )
     print("printing covariance matrix")
     print ( m2.covariance )
+
+    #The gaussian likelihood depends on the values only through their number, mean and variance:
+    #compressednll computes them once, and then each call does not loop over the values anymore
+    m3 = Minuit(compressednll(gaussian_model,values),mu,sigma)
+    m3.migrad()
+    m3.hesse()
+    print("fit with the sufficient statistics", m3.values, m3.errors)
     
 
 if __name__ == "__main__":
@@ -0,0 +1,101 @@
+#Multi-start global minimization: instead of guarding a single fit against a bad starting point,
+#many starting points spread over the parameter ranges (a Sobol or Latin hypercube sample) are minimized with cheap
+#strategy 0 migrads in worker processes. Minima closer than the tolerances are the same basin. The starts stop as soon as
+#the best basin has been found confirm times, and only the best npolish basins are minimized again at high strategy.
+from concurrent.futures import ProcessPoolExecutor
+from iminuit import Minuit
+import numpy as np
+
+#n starting points inside the box limits = [(min,max),...], from a scrambled Sobol sequence or a Latin hypercube
+def starting_points(limits,n,method="sobol",seed=1):
+    from scipy.stats import qmc
+    limits=np.asarray(limits,dtype=np.float64)
+    if not np.all(np.isfinite(limits)):
+        raise ValueError("multi-start needs finite limits for all the parameters")
+    if method=="sobol":
+        sampler=qmc.Sobol(len(limits),scramble=True,seed=seed)
+        m=int(np.ceil(np.log2(max(n,1))))
+        sample=sampler.random_base2(m)[:n]#the balance properties hold for powers of 2
+    elif method=="lhs":
+        sample=qmc.LatinHypercube(len(limits),seed=seed).random(n)
+    else:
+        raise ValueError("unknown sampling method "+str(method))
+    return qmc.scale(sample,limits[:,0],limits[:,1])
+
+def _minuit(cost,start,names,limits,fixed,strategy):
+    m=Minuit(cost,*start,name=names)
+    m.limits=[tuple(l) for l in limits]
+    m.errors=0.1*(np.asarray(limits)[:,1]-np.asarray(limits)[:,0])
+    if fixed is not None:
+        m.fixed=fixed
+    m.strategy=strategy
+    return m
+
+#One cheap local minimization from start: returns fval, values, valid and nfcn
+def _local(cost,start,names,limits,fixed):
+    m=_minuit(cost,start,names,limits,fixed,0)
+    m.migrad()
+    return m.fval,np.array(m.values),m.valid,m.nfcn
+
+def _local_all(cost,starts,names,limits,fixed):
+    return [_local(cost,s,names,limits,fixed) for s in starts]
+
+#Group the local minima in basins: two minima are in the same basin if their costs differ by less than ftol
+#and all their parameters by less than xtol times the width of the limits. Returns the basins sorted by cost,
+#each a dictionary with the best fval and values and the number of starts that ended there.
+def basins(results,limits,ftol=0.1,xtol=1e-2):
+    width=np.asarray(limits,dtype=np.float64)
+    width=width[:,1]-width[:,0]
+    found=[]
+    for fval,values,valid,nfcn in sorted(results,key=lambda r:r[0]):
+        if not np.isfinite(fval):
+            continue
+        for b in found:
+            if abs(fval-b["fval"])<ftol and np.all(np.abs(values-b["values"])<xtol*width):
+                b["count"]+=1
+                b["valid"]=b["valid"] or valid
+                break
+        else:
+            found.append({"fval":fval,"values":values,"count":1,"valid":valid})
+    return found
+
+#Minimize cost starting from nstarts points inside limits (finite, one (min,max) per parameter).
+#The starts are run in batches of batch in workers processes, so the cost must be picklable when workers>1.
+#They stop once the best basin has been reached by confirm starts, checked after each batch, so the result does not
+#depend on workers. The best npolish basins are minimized again with migrad and hesse at strategy `strategy`.
+#Returns a dictionary with minuit (the best polished Minuit), basins (see basins), polished (the polished Minuit
+#objects, best first), starts (the number of starts run) and nfcn (the calls of the cost in total).
+def multistart(cost,limits,nstarts=32,method="sobol",seed=1,workers=1,batch=8,confirm=3,npolish=3,strategy=2,
+               names=None,fixed=None,ftol=None,xtol=1e-2):
+    limits=np.asarray(limits,dtype=np.float64)
+    if ftol is None:
+        ftol=0.1*getattr(cost,"errordef",1.)
+    starts=starting_points(limits,nstarts,method,seed)
+
+    results=[]
+    found=[]
+    pool=ProcessPoolExecutor(max_workers=workers) if workers>1 else None
+    try:
+        for first in range(0,nstarts,batch):
+            chunk=starts[first:first+batch]
+            if pool is None:
+                results.extend(_local_all(cost,chunk,names,limits,fixed))
+            else:
+                futures=[pool.submit(_local_all,cost,c,names,limits,fixed) for c in np.array_split(chunk,min(workers,len(chunk)))]
+                results.extend(r for f in futures for r in f.result())
+            found=basins(results,limits,ftol,xtol)
+            if found and found[0]["count"]>=confirm:
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+
+    polished=[]
+    for b in found[:npolish]:
+        m=_minuit(cost,b["values"],names,limits,fixed,strategy)
+        m.migrad()
+        m.hesse()
+        polished.append(m)
+    polished.sort(key=lambda m:m.fval)
+    return {"minuit":polished[0] if polished else None,"basins":found,"polished":polished,"starts":len(results),
+            "nfcn":sum(r[3] for r in results)+sum(m.nfcn for m in polished)}
@@ -0,0 +1,127 @@
+#Incremental fits of event files that keep growing, for monitoring:
+#    python OnlineFit.py generated_events.evt [seconds between refreshes]
+#The data are kept in a cost that can add new events without looking at the old ones (SignalBackground.sbbinnednll,
+#or Minimization.sufficientnll), and each refit starts from the last minimum, so a refresh costs in proportion to the new events.
+import sys,time
+import numpy as np
+from iminuit import Minuit
+import EventFiles
+import SignalBackground
+
+#Running fit: cost must have an update(events) method. start are the starting values of the first fit.
+#extensive are the parameters that grow with the number of events (the yields): before a refit they are scaled
+#by the growth of the sample, and the starting step sizes of all parameters come from the last covariance.
+class onlinefit:
+    def __init__(self,cost,start,names=None,limits=None,extensive=(),strategy=0):
+        self.cost=cost
+        self.values=np.asarray(start,dtype=np.float64)
+        self.names=names
+        self.limits=limits
+        self.extensive=extensive
+        self.strategy=strategy
+        self.covariance=None
+        self.nevents=0
+        self.nevents_fit=0
+        self.minuit=None
+
+    #add a batch of events and fit again
+    def update(self,events):
+        self.cost.update(events)
+        self.nevents+=len(events)
+        return self.refit()
+
+    def refit(self):
+        m=Minuit(self.cost,*self.start(),name=self.names)
+        if self.limits is not None:
+            m.limits=self.limits
+        if self.covariance is not None:
+            m.errors=self.start_errors(m.parameters)
+        m.strategy=self.strategy
+        m.migrad()
+        if not m.valid:#a poor warm start, e.g. after a large change of the data: try again from there with more care
+            m.strategy=max(self.strategy,1)
+            m.migrad()
+        m.hesse()
+        self.minuit=m
+        self.values=np.array(m.values)
+        self.covariance=np.array(m.covariance) if m.covariance is not None else None
+        self.nevents_fit=self.nevents
+        return m
+
+    #growth of the sample since the last fit
+    def ratio(self):
+        return self.nevents/self.nevents_fit if self.nevents_fit>0 and self.nevents>0 else 1.
+
+    def start(self):
+        values=self.values.copy()
+        if self.minuit is not None:
+            for i,name in enumerate(self.minuit.parameters):
+                if name in self.extensive:
+                    values[i]*=self.ratio()
+        return values
+
+    #the errors of the yields grow as sqrt(n), those of the other parameters decrease as 1/sqrt(n)
+    def start_errors(self,names):
+        errors=np.sqrt(np.maximum(np.diag(self.covariance),0))
+        r=np.sqrt(self.ratio())
+        errors=np.array([e*r if name in self.extensive else e/r for e,name in zip(errors,names)])
+        return np.where(errors>0,errors,np.maximum(0.1*np.abs(self.values),1e-3))
+
+#Reads the new events of a binary event file that is still being written, starting where the last call stopped
+class eventfollower:
+    def __init__(self,path):
+        self.path=path
+        self.offset=0
+    def read(self):
+        events=EventFiles.read_events(self.path,start=self.offset)
+        self.offset+=len(events)
+        return np.array(events)
+    #true when the writer closed the file and all its events have been read
+    def finished(self):
+        metadata=EventFiles.complete_metadata(self.path)
+        return metadata is not None and self.offset>=metadata["nevents"]
+
+#Online binned s+b fit of the events of path, refitted every interval seconds when new events arrived,
+#until the file is complete (or maxrefits fits). Calls report(fit) after each fit and returns the onlinefit.
+def follow(path,interval=10.,bins=100,a=0.,b=3000.,start=None,maxrefits=None,report=None):
+    follower=eventfollower(path)
+    events=follower.read()
+    while len(events)==0 and not follower.finished():#the first fit needs some events
+        time.sleep(interval)
+        events=follower.read()
+    if start is None:
+        start=(200.,100.,200.,10.,max(len(events)-10.,1.))
+    fit=onlinefit(SignalBackground.sbbinnednll(events,bins=bins,a=a,b=b),start,
+                  limits=[(a,b),(1e-3,None),(1e-3,None),(0,None),(0,None)],extensive=("sig","bkg"))
+    fit.nevents=len(events)
+    nrefits=0
+    if len(events)>0:
+        fit.refit()
+        nrefits=1
+        if report is not None:
+            report(fit)
+    while not follower.finished() and (maxrefits is None or nrefits<maxrefits):
+        time.sleep(interval)
+        events=follower.read()
+        if len(events)==0:
+            continue
+        fit.update(events)
+        nrefits+=1
+        if report is not None:
+            report(fit)
+    return fit
+
+def _print(fit):
+    m=fit.minuit
+    print(fit.nevents,"events: valid",m.valid,"nfcn",m.nfcn,", ".join("%s=%.4g+-%.2g"%(p,v,e) for p,v,e in zip(m.parameters,m.values,m.errors)))
+    sys.stdout.flush()
+
+def main(argv):
+    if len(argv)<2:
+        print("usage: python OnlineFit.py events.evt [seconds between refreshes]")
+        return
+    interval=float(argv[2]) if len(argv)>2 else 10.
+    follow(argv[1],interval=interval,report=_print)
+
+if __name__ == "__main__":
+    main(sys.argv)
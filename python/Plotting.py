@@ -0,0 +1,14 @@
+#matplotlib is imported only when something is plotted: it takes longer to import than the rest of the code needs to run
+#in short batch jobs. The scripts only save the plots to files, so the non-interactive Agg backend is used
+#unless another one is chosen with MPLBACKEND. With STATMETHODS_PLOTS=0 the scripts make no plots at all.
+import os
+
+def enabled():
+    return os.environ.get("STATMETHODS_PLOTS","1").lower() not in ("0","no","false","off")
+
+def pyplot():
+    import matplotlib
+    if "MPLBACKEND" not in os.environ:
+        matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    return plt
@@ -0,0 +1,189 @@
+#Profile likelihood scans: the parameter is fixed at each point and all the other parameters are minimized again.
+#Each point starts from the minimum of its neighbour (warm start), independent parts of the grid are scanned
+#in parallel processes, and the grid is refined where the profile crosses the levels that define the intervals.
+#Profiles are cached for each minimum, so drawing or asking for the same profile again costs nothing.
+from concurrent.futures import ProcessPoolExecutor
+from iminuit import Minuit
+from iminuit.util import MErrors
+import numpy as np
+import os
+
+#A new Minuit with the same cost and settings as m, with the parameter ipar fixed (unless ipar is None)
+def _minuit(cost,names,values,errors,limits,fixed,errordef,strategy,ipar=None):
+    m=Minuit(cost,*values,name=names)
+    m.errors=errors
+    for i,lim in enumerate(limits):
+        m.limits[i]=lim
+    m.fixed=fixed
+    if not hasattr(cost,"errordef"):
+        m.errordef=errordef
+    m.strategy=strategy
+    if ipar is not None:
+        m.fixed[ipar]=True
+    return m
+
+#Minimize at each point in order: the first point starts from start, the following ones from the previous minimum
+def _scan_points(cost,names,start,errors,limits,fixed,errordef,strategy,ipar,points):
+    m=_minuit(cost,names,start,errors,limits,fixed,errordef,strategy,ipar)
+    results=[]
+    for x in points:
+        m.values[ipar]=x
+        m.migrad()
+        results.append((m.fval,np.array(m.values)))
+    return results
+
+#Profiles of the minimum found by m, a Minuit of cost: the cost is given again because the scans build their own Minuit
+#objects, in worker processes when workers>1 (the cost must then be picklable)
+class profilescanner:
+    def __init__(self,m,cost,workers=1):
+        self.m=m
+        self.cost=cost
+        self.workers=workers
+        self.cache={}
+
+    #Returns the parameter values and the profile minus the minimum value, sorted by parameter value.
+    #bound is either (min,max) or a number of standard deviations around the minimum, as in Minuit.profile.
+    #levels are the values of the profile, in units of errordef, whose crossings are refined with refine bisection steps:
+    #1 and 3.84 are the 68% and 95% intervals of one parameter.
+    def profile(self,par,bound=3,size=30,levels=(1.,3.84),refine=4):
+        m=self.m
+        key=(tuple(m.values),m.fval,tuple(m.fixed),par,bound if np.ndim(bound)==0 else tuple(bound),size,tuple(levels),refine)
+        if key not in self.cache:
+            self.cache[key]=self._scan(par,bound,size,levels,refine)
+        x,y,_=self.cache[key]
+        return x,y
+
+    #Interval where the profile is below level (in units of errordef), from linear interpolation between the scanned points
+    def interval(self,par,level=1.,**kwargs):
+        x,y=self.profile(par,**kwargs)
+        y=y/self.m.errordef-level
+        imin=np.argmin(y)
+        lower=upper=np.nan
+        for i in range(imin,0,-1):
+            if y[i-1]>=0:
+                lower=x[i]+(x[i-1]-x[i])*y[i]/(y[i]-y[i-1])
+                break
+        for i in range(imin,len(y)-1):
+            if y[i+1]>=0:
+                upper=x[i]+(x[i+1]-x[i])*y[i]/(y[i]-y[i+1])
+                break
+        return lower,upper
+
+    def draw(self,par,**kwargs):
+        import Plotting
+        plt=Plotting.pyplot()
+        x,y=self.profile(par,**kwargs)
+        plt.plot(x,y)
+        plt.xlabel(par)
+        plt.ylabel("profile minus minimum")
+        return x,y
+
+    def _scan(self,par,bound,size,levels,refine):
+        m=self.m
+        ipar=m.parameters.index(par)
+        best=np.array(m.values)
+        if np.ndim(bound)==0:
+            lo,hi=best[ipar]-bound*m.errors[ipar],best[ipar]+bound*m.errors[ipar]
+        else:
+            lo,hi=bound
+        limit=m.limits[ipar]
+        lo,hi=max(lo,limit[0]),min(hi,limit[1])
+        grid=np.linspace(lo,hi,size)
+
+        #the grid is scanned outwards from the minimum, in contiguous blocks, one per worker (at least one on each side).
+        #The first point of each block starts from the linear prediction of the other parameters given by the covariance.
+        left=grid[grid<best[ipar]][::-1]
+        right=grid[grid>=best[ipar]]
+        nblocks=max(1,self.workers//2)
+        blocks=[b for side in (left,right) for b in np.array_split(side,nblocks) if len(b)>0]
+        jobs=[(self._predict(b[0],ipar),b) for b in blocks]
+        points,fvals,values=self._run(ipar,jobs)
+
+        #refinement: the intervals between points where the profile crosses a level are cut in two,
+        #and the new point starts from the minimum of its left neighbour (both neighbours are equally close)
+        for step in range(refine):
+            order=np.argsort(points)
+            points,fvals,values=points[order],fvals[order],values[order]
+            y=(fvals-m.fval)/m.errordef
+            jobs=[]
+            for level in levels:
+                for i in np.nonzero(np.diff(np.sign(y-level))!=0)[0]:
+                    jobs.append((values[i],np.array([0.5*(points[i]+points[i+1])])))
+            if not jobs:
+                break
+            newpoints,newfvals,newvalues=self._run(ipar,jobs)
+            points=np.concatenate([points,newpoints])
+            fvals=np.concatenate([fvals,newfvals])
+            values=np.concatenate([values,newvalues])
+
+        order=np.argsort(points)
+        return points[order],fvals[order]-m.fval,values[order]
+
+    def _predict(self,x,ipar):
+        m=self.m
+        best=np.array(m.values)
+        if m.covariance is None:
+            return best
+        cov=np.array(m.covariance)
+        start=best+cov[:,ipar]/cov[ipar,ipar]*(x-best[ipar])
+        return np.clip(start,[l[0] for l in m.limits],[l[1] for l in m.limits])
+
+    def _run(self,ipar,jobs):
+        m=self.m
+        settings=(m.parameters,np.array(m.errors),[tuple(l) for l in m.limits],list(m.fixed),m.errordef,m.strategy.strategy,ipar)
+        if self.workers==1 or len(jobs)==1:
+            results=[_scan_points(self.cost,settings[0],start,*settings[1:],points=b) for start,b in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures=[pool.submit(_scan_points,self.cost,settings[0],start,*settings[1:],points=b) for start,b in jobs]
+                results=[f.result() for f in futures]
+        points=np.concatenate([b for start,b in jobs])
+        fvals=np.array([r[0] for res in results for r in res])
+        values=np.array([r[1] for res in results for r in res])
+        return points,fvals,values
+
+#The settings of m, a Minuit of cost, needed to build a copy of it in another process with _minuit
+def _settings(m,cost):
+    return (cost,m.parameters,np.array(m.values),np.array(m.errors),[tuple(l) for l in m.limits],list(m.fixed),m.errordef,m.strategy.strategy)
+
+#MINOS interval of one parameter, or contour of a pair of parameters, with a copy of the minimum:
+#migrad starts from the minimum and only rebuilds the state that minos and mncontour need
+def _minos(settings,par,cl):
+    m=_minuit(*settings)
+    m.migrad()
+    m.minos(par,cl=cl)
+    return m.merrors[par]
+
+def _contour(settings,pair,cl,size):
+    m=_minuit(*settings)
+    m.migrad()
+    return m.mncontour(*pair,cl=cl,size=size)
+
+#MINOS intervals of the parameters (all the free ones by default) and the 2D contours of the pairs of parameters,
+#all computed at the same time in worker processes, one per interval or contour. m must be at a converged minimum.
+#Returns the intervals as a MErrors, the same structure as m.merrors after m.minos(), and a dictionary pair -> contour points.
+#cost is the cost of m, which must be picklable. cl is the confidence level (or number of sigmas) as in Minuit.minos and Minuit.mncontour.
+def minos_and_contours(m,cost,parameters=None,pairs=(),cl=None,size=100,workers=None):
+    if parameters is None:
+        parameters=[p for p,fixed in zip(m.parameters,m.fixed) if not fixed]
+    settings=_settings(m,cost)
+    jobs=[(_minos,(settings,p,cl)) for p in parameters]+[(_contour,(settings,tuple(pair),cl,size)) for pair in pairs]
+    if workers is None:
+        workers=min(len(jobs),os.cpu_count() or 1)
+    if workers<=1 or len(jobs)<=1:
+        results=[f(*args) for f,args in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures=[pool.submit(f,*args) for f,args in jobs]
+            results=[f.result() for f in futures]
+
+    merrors=MErrors()
+    for merror in sorted(results[:len(parameters)],key=lambda e:e.number):
+        merrors[merror.name]=merror
+    return merrors,{tuple(pair):c for pair,c in zip(pairs,results[len(parameters):])}
+
+def minos(m,cost,parameters=None,cl=None,workers=None):
+    return minos_and_contours(m,cost,parameters,cl=cl,workers=workers)[0]
+
+def contours(m,cost,pairs,cl=None,size=100,workers=None):
+    return minos_and_contours(m,cost,[],pairs,cl=cl,size=size,workers=workers)[1]
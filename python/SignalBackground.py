@@ -0,0 +1,205 @@
+#Gaussian signal + exponential background model on a finite support [a,b].
+#Same model as sum_function in Generation and ExtendedMaximumLikelihoodFit, but written with
+#closed-form normalizations and numpy arrays, so that it can be used in fast fits.
+import collections
+import numpy as np
+import Minimization
+from scipy.special import ndtr, ndtri, xlogy
+
+#Fraction of the gaussian and of the exponential contained in [a,b]
+def gaussian_norm(mean,sigma,a,b):
+    return ndtr((b-mean)/sigma)-ndtr((a-mean)/sigma)
+
+def exponential_norm(l,a,b):
+    return -np.expm1(-(b-a)/l)#this is exp(-a/l)-exp(-b/l), relative to the value at x=a
+
+#The two pdfs, normalized to 1 in [a,b]
+def signal_pdf(x,mean,sigma,a,b):
+    z=(x-mean)/sigma
+    return np.exp(-0.5*z*z) / (sigma*np.sqrt(2.0*np.pi)*gaussian_norm(mean,sigma,a,b))
+
+def background_pdf(x,l,a,b):
+    return np.exp(-(x-a)/l) / (l*exponential_norm(l,a,b))
+
+#Cumulative distributions in [a,b], used to integrate the model over bins
+def signal_cdf(x,mean,sigma,a,b):
+    return (ndtr((x-mean)/sigma)-ndtr((a-mean)/sigma)) / gaussian_norm(mean,sigma,a,b)
+
+def background_cdf(x,l,a,b):
+    return -np.expm1(-(x-a)/l) / exponential_norm(l,a,b)
+
+#Expected number of events in each bin defined by the edges: the model is integrated over the bin, not evaluated at its center
+def sb_bin_counts(edges,mean,sigma,l,sig,bkg,a,b):
+    return sig*np.diff(signal_cdf(edges,mean,sigma,a,b))+bkg*np.diff(background_cdf(edges,l,a,b))
+
+#Extended density: sig*signal pdf + bkg*background pdf, its integral over [a,b] is sig+bkg
+def sb_density(x,mean,sigma,l,sig,bkg,a,b):
+    return sig*signal_pdf(x,mean,sigma,a,b)+bkg*background_pdf(x,l,a,b)
+
+#Cache of the signal and background pdfs of all events (or bins), keyed on the shape parameters (mean, sigma, l).
+#They don't depend on the yields, so when only sig and bkg change (yield scans, Minuit derivatives along the yields)
+#the density is a single dot product (sig,bkg) . components. The arrays kept take at most maxbytes: the least recently used
+#are dropped, and a shape larger than maxbytes is computed but not kept (each takes 16 bytes per event).
+DEFAULT_CACHE_BYTES=2**26
+
+class shapecache:
+    def __init__(self,maxbytes=DEFAULT_CACHE_BYTES):
+        self.maxbytes=maxbytes
+        self.entries=collections.OrderedDict()
+        self.nbytes=0
+        self.hits=0
+        self.misses=0
+    def get(self,key,compute):
+        if key in self.entries:
+            self.hits+=1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+        self.misses+=1
+        value=compute()
+        nbytes=sum(v.nbytes for v in value) if isinstance(value,list) else value.nbytes
+        if nbytes<=self.maxbytes:
+            while self.entries and self.nbytes+nbytes>self.maxbytes:
+                self.nbytes-=self.entries.popitem(last=False)[1][1]
+            self.entries[key]=(value,nbytes)
+            self.nbytes+=nbytes
+        return value
+    def clear(self):
+        self.entries.clear()
+        self.nbytes=0
+    #the cached arrays are not copied when the cost is sent to another process
+    def __getstate__(self):
+        state=self.__dict__.copy()
+        state["entries"]=collections.OrderedDict()
+        state["nbytes"]=0
+        return state
+
+#-2 log of the extended likelihood of the unbinned events x.
+#The poisson term -2log(pois(n|s+b)) = 2*[(s+b) - n log(s+b)] + const and the pdf term -2 sum log((s*S+b*B)/(s+b))
+#combine into 2*(s+b) - 2 sum log(s*S+b*B): the n log(s+b) cancel out. The constant log(n!) is dropped.
+class sbextendednll:
+    errordef=1#-2 log L
+    #threads and chunksize: the events are evaluated in chunks in a pool of threads, see Minimization.parallel_sum
+    def __init__(self,x,a=0.,b=3000.,cachebytes=DEFAULT_CACHE_BYTES,threads=1,chunksize=Minimization.DEFAULT_CHUNKSIZE):
+        self.x=np.ascontiguousarray(x,dtype=np.float64)
+        self.a=a
+        self.b=b
+        self.cache=shapecache(cachebytes)#each entry takes 16 bytes per event, use cachebytes=0 to switch it off
+        self.threads=threads
+        self.chunksize=chunksize
+    def __call__(self,mean,sigma,l,sig,bkg):
+        def partial(components):
+            with np.errstate(divide="ignore",invalid="ignore"):
+                return np.sum(np.log(np.dot((sig,bkg),components)))
+        return 2*(sig+bkg)-2*Minimization.parallel_sum(partial,self.components(mean,sigma,l),self.threads)
+    #Analytic gradient, used automatically by Minuit and by Minimization.fit. With D = sig*S + bkg*B:
+    #d/dsig = 2 - 2 sum S/D, d/dbkg = 2 - 2 sum B/D, and for the shapes d/dp = -2 sum sig*S*dlogS/dp / D (same for B),
+    #where the derivatives of log S and log B include those of their normalizations in [a,b].
+    def grad(self,mean,sigma,l,sig,bkg):
+        a,b=self.a,self.b
+        #the sums over the events, computed chunk by chunk
+        def partial(item):
+            x,(spdf,bpdf)=item
+            density=sig*spdf+bkg*bpdf
+            ws=spdf/density
+            wb=bpdf/density
+            z=(x-mean)/sigma
+            return np.array([np.sum(ws),np.dot(ws,z),np.dot(ws,z*z),np.dot(wb,x-a),np.sum(wb)])
+        items=list(zip(Minimization.split(self.x,self.chunksize),self.components(mean,sigma,l)))
+        sum_ws,sum_wsz,sum_wsz2,sum_wbx,sum_wb=Minimization.parallel_sum(partial,items,self.threads)
+
+        za,zb=(a-mean)/sigma,(b-mean)/sigma
+        phia,phib=np.exp(-0.5*za*za)/np.sqrt(2*np.pi),np.exp(-0.5*zb*zb)/np.sqrt(2*np.pi)
+        norm=gaussian_norm(mean,sigma,a,b)
+        dlognorm_dmean=(phia-phib)/(sigma*norm)
+        dlognorm_dsigma=(za*phia-zb*phib)/(sigma*norm)
+        enorm=exponential_norm(l,a,b)
+        dlogenorm_dl=-np.exp(-(b-a)/l)*(b-a)/(l*l*enorm)
+
+        dmean=-2*sig*(sum_wsz/sigma-dlognorm_dmean*sum_ws)
+        dsigma=-2*sig*((sum_wsz2-sum_ws)/sigma-dlognorm_dsigma*sum_ws)
+        dl=-2*bkg*(sum_wbx/(l*l)-(1/l+dlogenorm_dl)*sum_wb)
+        return np.array([dmean,dsigma,dl,2-2*sum_ws,2-2*sum_wb])
+    #The signal and background pdfs of the events: a list with one 2 x n array for each chunk of events
+    def components(self,mean,sigma,l):
+        def compute(x):
+            return np.vstack([signal_pdf(x,mean,sigma,self.a,self.b),background_pdf(x,l,self.a,self.b)])
+        chunks=Minimization.split(self.x,self.chunksize)
+        if self.threads>1 and len(chunks)>1:
+            return self.cache.get((mean,sigma,l),lambda: list(Minimization.thread_pool(self.threads).map(compute,chunks)))
+        return self.cache.get((mean,sigma,l),lambda: [compute(x) for x in chunks])
+
+#Same as sbextendednll, for event files too large for memory: the events are read in chunks at every call (see Minimization.streamingnll)
+class sbstreamingnll(Minimization.streamingnll):
+    errordef=1#-2 log L
+    def __init__(self,source,a=0.,b=3000.,chunksize=1000000):
+        Minimization.streamingnll.__init__(self,self.density,source,chunksize=chunksize,extended=self.expected)
+        self.a=a
+        self.b=b
+    def __call__(self,mean,sigma,l,sig,bkg):
+        with np.errstate(divide="ignore",invalid="ignore"):
+            return Minimization.streamingnll.__call__(self,mean,sigma,l,sig,bkg)
+    def density(self,x,mean,sigma,l,sig,bkg):
+        return sb_density(x,mean,sigma,l,sig,bkg,self.a,self.b)
+    def expected(self,mean,sigma,l,sig,bkg):
+        return sig+bkg
+
+#-2 log of the binned extended likelihood: the events are filled once in a histogram and each evaluation is O(number of bins).
+#We use the poisson likelihood ratio to the saturated model, 2*sum[nu - n + n log(n/nu)], so that the minimum is
+#also a goodness of fit measure (approximately a chi2 with nbins - 5 degrees of freedom).
+#template_relerr (a number or one value per bin) is the relative statistical uncertainty of the model prediction in each bin,
+#e.g. 1/sqrt(N) for templates taken from N simulated events. If given, each bin prediction is scaled by a factor beta
+#constrained by a gaussian of width template_relerr around 1, and beta is profiled analytically (Barlow-Beeston lite).
+class sbbinnednll:
+    errordef=1#-2 log L
+    #If counts is given, x is not used and bins must be the bin edges: e.g. to fit an Asimov dataset with non-integer counts
+    def __init__(self,x,bins=100,a=0.,b=3000.,template_relerr=None,cachebytes=DEFAULT_CACHE_BYTES,counts=None):
+        if counts is None:
+            counts,bins=np.histogram(x,bins=bins,range=(a,b))
+        self.counts=np.asarray(counts,dtype=np.float64)
+        self.edges=np.asarray(bins,dtype=np.float64)
+        self.a=a
+        self.b=b
+        self.cache=shapecache(cachebytes)
+        self.template_relerr=template_relerr
+        if template_relerr is not None:
+            self.template_relerr=np.broadcast_to(np.asarray(template_relerr,dtype=np.float64),self.counts.shape)
+    def __call__(self,mean,sigma,l,sig,bkg):
+        with np.errstate(divide="ignore",invalid="ignore"):
+            expected=np.dot((sig,bkg),self.components(mean,sigma,l))
+            constraint=0
+            if self.template_relerr is not None:
+                beta=self.beta(expected)
+                constraint=np.sum(((beta-1)/np.where(self.template_relerr>0,self.template_relerr,1))**2)
+                expected=beta*expected
+            return 2*np.sum(expected-self.counts+xlogy(self.counts,self.counts)-xlogy(self.counts,expected))+constraint
+    #Add new events to the histogram, in O(len(x)): the shapes in the cache don't depend on the counts and stay valid
+    def update(self,x):
+        self.counts+=np.histogram(x,bins=self.edges)[0]
+    #2 x nbins array with the fraction of signal and of background in each bin
+    def components(self,mean,sigma,l):
+        return self.cache.get((mean,sigma,l),lambda: np.vstack([np.diff(signal_cdf(self.edges,mean,sigma,self.a,self.b)),np.diff(background_cdf(self.edges,l,self.a,self.b))]))
+    #beta minimizes 2*[beta*nu - n log(beta*nu)] + (beta-1)^2/relerr^2, i.e. solves beta^2 + (nu*relerr^2-1)*beta - n*relerr^2 = 0
+    def beta(self,expected):
+        var=self.template_relerr**2
+        p=expected*var-1
+        beta=0.5*(-p+np.sqrt(p*p+4*self.counts*var))
+        return np.where(var>0,beta,1.)
+
+#Generation of n events from the model, all random numbers are taken from rng, a numpy.random.Generator.
+#Each event is assigned to signal or background according to the fractions sig/(sig+bkg) and bkg/(sig+bkg),
+#then drawn from the truncated gaussian or exponential by inverting their cdf.
+def sample(rng,n,mean,sigma,l,sig,bkg,a=0.,b=3000.):
+    issignal=rng.random(n)<sig/(sig+bkg)
+    events=np.empty(n,dtype=np.float64)
+    nsig=np.count_nonzero(issignal)
+    events[issignal]=sample_signal(rng,nsig,mean,sigma,a,b)
+    events[~issignal]=sample_background(rng,n-nsig,l,a,b)
+    return events
+
+def sample_signal(rng,n,mean,sigma,a,b):
+    u=rng.uniform(ndtr((a-mean)/sigma),ndtr((b-mean)/sigma),n)
+    return mean+sigma*ndtri(u)
+
+def sample_background(rng,n,l,a,b):
+    u=rng.random(n)
+    return a-l*np.log1p(-u*exponential_norm(l,a,b))
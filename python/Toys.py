@@ -0,0 +1,109 @@
+#Pseudo-experiments (toys) for bias and pull studies.
+#Every toy gets its own random stream spawned from one SeedSequence, so the results depend only on the seed,
+#not on how the toys are split among the worker processes.
+from concurrent.futures import ProcessPoolExecutor
+from iminuit import Minuit
+import numpy as np
+
+#Generate one dataset with generator(rng), build the cost with cost_factory(data) and fit it starting from the true values
+def fit_toy(cost_factory,generator,truth,seed,cache=None):
+    rng=np.random.default_rng(seed)
+    return _fit(cost_factory(generator(rng)),truth,cache)
+
+#with a FitCache.fitcache, fits already done in a previous run are read from disk
+def _fit(cost,truth,cache=None):
+    if cache is not None:
+        result=cache.fit(cost,truth,nmigrad=2)
+        return result["values"],result["errors"],result["valid"]
+    m=Minuit(cost,*truth)
+    m.migrad()
+    m.migrad()
+    m.hesse()
+    return np.array(m.values),np.array(m.errors),m.valid
+
+def _fit_toys(cost_factory,generator,truth,seeds,cache=None):
+    return [fit_toy(cost_factory,generator,truth,s,cache) for s in seeds]
+
+#Run ntoys pseudo-experiments and return a dictionary of numpy arrays:
+#values and errors (ntoys x npar), pulls=(truth-value)/error and valid (the Minuit fit status).
+#With workers>1 the toys run in a process pool: cost_factory and generator must then be picklable,
+#i.e. module-level functions or functools.partial of them, not lambdas. cache is an optional FitCache.fitcache.
+def run_toys(cost_factory,generator,truth,ntoys,seed=1,workers=1,cache=None):
+    seeds=np.random.SeedSequence(seed).spawn(ntoys)
+    if workers==1:
+        results=_fit_toys(cost_factory,generator,truth,seeds,cache)
+    else:
+        chunks=[list(c) for c in np.array_split(np.array(seeds,dtype=object),min(ntoys,4*workers))]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures=[pool.submit(_fit_toys,cost_factory,generator,truth,c,cache) for c in chunks if len(c)>0]
+            results=[r for f in futures for r in f.result()]
+
+    return _collect(results,truth)
+
+def _collect(results,truth):
+    truth=np.asarray(truth,dtype=np.float64)
+    values=np.array([r[0] for r in results]).reshape(len(results),len(truth))
+    errors=np.array([r[1] for r in results]).reshape(len(results),len(truth))
+    valid=np.array([r[2] for r in results],dtype=bool)
+    return {"values":values,"errors":errors,"pulls":(truth-values)/errors,"valid":valid}
+
+#For models linear in the parameters, y = X p, the weighted least squares minimum has a closed form:
+#p = (X^T W X)^-1 X^T W y with covariance (X^T W X)^-1 and W = diag(1/sigma^2), the same that migrad+hesse find.
+#design is the (npoints x npar) matrix X and ys the (ntoys x npoints) matrix of y values: all the toys are solved at once.
+#Returns the same dictionary as run_toys, plus the covariance (equal for all toys).
+def linear_toys(design,ys,sigmas,truth=None):
+    design=np.asarray(design,dtype=np.float64)
+    ys=np.atleast_2d(np.asarray(ys,dtype=np.float64))
+    weights=1/np.asarray(sigmas,dtype=np.float64)**2
+    
+    xtwx=design.T @ (design*weights[:,None])
+    covariance=np.linalg.inv(xtwx)
+    values=np.linalg.solve(xtwx,design.T @ (ys*weights).T).T
+    errors=np.broadcast_to(np.sqrt(np.diag(covariance)),values.shape).copy()
+    result={"values":values,"errors":errors,"valid":np.ones(len(ys),dtype=bool),"covariance":covariance}
+    if truth is not None:
+        result["pulls"]=(np.asarray(truth,dtype=np.float64)-values)/errors
+    return result
+
+#Many toy datasets stored in one flat array, with offsets like a CSR sparse matrix: toy k is data[offsets[k]:offsets[k+1]].
+#Taking a toy is a view, without copies, and summaries of all toys are single numpy calls.
+class raggedtoys:
+    def __init__(self,data,offsets):
+        self.data=data
+        self.offsets=offsets
+    def __len__(self):
+        return len(self.offsets)-1
+    def __getitem__(self,k):
+        return self.data[self.offsets[k]:self.offsets[k+1]]
+    def __iter__(self):
+        for k in range(len(self)):
+            yield self[k]
+    def counts(self):
+        return np.diff(self.offsets)
+    #sum of f(x) over the events of each toy, 0 for empty toys
+    def sums(self,f=None):
+        values=self.data if f is None else f(self.data)
+        counts=self.counts()
+        result=np.zeros(len(self),dtype=np.result_type(values.dtype,np.float64))
+        nonempty=counts>0
+        if np.any(nonempty):#reduceat over the starts of the non-empty toys only: each sum ends where the next one starts
+            result[nonempty]=np.add.reduceat(values[:self.offsets[-1]],self.offsets[:-1][nonempty])
+        return result
+    def means(self):
+        with np.errstate(invalid="ignore",divide="ignore"):
+            return self.sums()/self.counts()
+
+#ntoys datasets of the signal+background model of SignalBackground, generated in one call:
+#each toy has poisson(sig) + poisson(bkg) events, as in Generation, and all events are sampled at once
+def generate_sb_toys(ntoys,mean,sigma,l,sig,bkg,a=0.,b=3000.,seed=1):
+    import SignalBackground
+    rng=np.random.default_rng(seed)
+    nevents=rng.poisson(sig,ntoys)+rng.poisson(bkg,ntoys)
+    offsets=np.zeros(ntoys+1,dtype=np.int64)
+    np.cumsum(nevents,out=offsets[1:])
+    return raggedtoys(SignalBackground.sample(rng,offsets[-1],mean,sigma,l,sig,bkg,a=a,b=b),offsets)
+
+#Fit every toy of a raggedtoys with the cost made by cost_factory(toy), starting from the true values:
+#returns the same dictionary as run_toys
+def fit_toys(toys,cost_factory,truth,cache=None):
+    return _collect([_fit(cost_factory(x),truth,cache) for x in toys],truth)